@@ -0,0 +1,88 @@
+import random
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from users.models import Driver, ServiceProvider
+from .models import AssistanceRequest, DailyRequestRollup, PlatformTotal, RequestRollup
+
+
+# Every status change bumps the rollup rows of its category, so a busy category would
+# serialise all transitions on one row. Spreading each count over ROLLUP_SHARDS rows
+# picked at random keeps concurrent writers apart; readers sum the shards. Account
+# totals change rarely and stay single rows.
+ROLLUP_SHARDS = 8
+
+
+def _bump(model, delta, **key):
+    """Add delta to the counter row identified by key, creating it on first use"""
+    if model.objects.filter(**key).update(count=F('count') + delta):
+        return
+    model.objects.get_or_create(**key)
+    model.objects.filter(**key).update(count=F('count') + delta)
+
+
+def record_transition(service_type, created_at, old_status=None, new_status=None):
+    """Move one request between statuses in the rollups; old_status None for a new request, new_status None for a delete"""
+    if old_status == new_status:
+        return
+    day = timezone.localdate(created_at)
+    for status, delta in ((old_status, -1), (new_status, 1)):
+        if status is not None:
+            shard = random.randrange(ROLLUP_SHARDS)
+            _bump(RequestRollup, delta, service_type=service_type, status=status, shard=shard)
+            _bump(DailyRequestRollup, delta, day=day, service_type=service_type, status=status, shard=shard)
+
+
+def adjust_total(name, delta):
+    _bump(PlatformTotal, delta, name=name)
+
+
+def pending_counts(service_types=None):
+    """{service_type: pending requests} from the global rollup"""
+    counts = RequestRollup.objects.filter(status='pending').order_by()
+    if service_types is not None:
+        counts = counts.filter(service_type__in=service_types)
+    return dict(counts.values('service_type').annotate(total=Sum('count')).values_list('service_type', 'total'))
+
+
+def request_stats():
+    """Totals for the admin dashboard, read from the rollups only"""
+    rollups = RequestRollup.objects.order_by()
+    totals = dict(PlatformTotal.objects.values_list('name', 'count'))
+    # A single shard can go negative, only the sums are meaningful
+    return {
+        'total_requests': rollups.aggregate(total=Sum('count'))['total'] or 0,
+        'service_stats': rollups.values('service_type').annotate(count=Sum('count')).filter(count__gt=0).order_by('service_type'),
+        'status_stats': rollups.values('status').annotate(count=Sum('count')).filter(count__gt=0).order_by('status'),
+        'total_drivers': totals.get('drivers', 0),
+        'total_providers': totals.get('providers', 0),
+    }
+
+
+def daily_stats(days=14):
+    """Requests created per day over the last days, newest first"""
+    since = timezone.localdate() - timezone.timedelta(days=days - 1)
+    return DailyRequestRollup.objects.filter(day__gte=since).values('day').annotate(count=Sum('count')).order_by('-day')
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """Recompute every rollup from the source tables. Returns the number of requests counted"""
+    requests = AssistanceRequest.objects.order_by()
+    RequestRollup.objects.all().delete()
+    RequestRollup.objects.bulk_create([
+        RequestRollup(service_type=row['service_type'], status=row['status'], count=row['count'])
+        for row in requests.values('service_type', 'status').annotate(count=Count('id'))
+    ])
+    DailyRequestRollup.objects.all().delete()
+    DailyRequestRollup.objects.bulk_create([
+        DailyRequestRollup(day=row['day'], service_type=row['service_type'], status=row['status'], count=row['count'])
+        for row in requests.annotate(day=TruncDate('created_at')).values('day', 'service_type', 'status').annotate(count=Count('id'))
+    ], batch_size=500)
+    PlatformTotal.objects.all().delete()
+    PlatformTotal.objects.bulk_create([
+        PlatformTotal(name='drivers', count=Driver.objects.count()),
+        PlatformTotal(name='providers', count=ServiceProvider.objects.count()),
+    ])
+    return requests.count()
@@ -0,0 +1,188 @@
+import logging
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from maps.tracking import publish_tracking_update
+from maps.utils import attach_service_names, calculate_distances, calculate_etas
+from users.models import ServiceProvider
+from .counters import record_transition
+from .models import AssistanceRequest
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ('pending', 'accepted', 'in_progress')
+INFEASIBLE = 1e9  # Cost of pairs that must never be matched
+DISTANCE_TIE_BREAK = 0.01  # Per km, so equal ETAs prefer the closer provider
+
+
+def get_max_dispatch_km():
+    return getattr(settings, 'DISPATCH_MAX_DISTANCE_KM', 30)
+
+
+def solve_assignment(cost):
+    """Minimum-cost assignment for a rows x columns cost matrix (Hungarian method, O(n^2 m))
+
+    Returns a list of (row, column) pairs; every row is matched when rows <= columns.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return []
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Potentials and matching, 1-indexed with column 0 as the virtual start
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=np.int64)  # Row matched to each column, 0 if none
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        match[0] = row
+        column = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = match[column]
+            free = ~used
+            free[0] = False
+
+            slack = cost[current_row - 1] - u[current_row] - v[1:]
+            better = free[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = column
+
+            candidates = np.where(free, min_slack, np.inf)
+            next_column = int(np.argmin(candidates))
+            delta = candidates[next_column]
+
+            u[match[used]] += delta
+            v[used] -= delta
+            min_slack[free] -= delta
+
+            column = next_column
+            if match[column] == 0:
+                break
+
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+
+    pairs = [(int(match[j]) - 1, j - 1) for j in range(1, m + 1) if match[j]]
+    if transposed:
+        pairs = [(column, row) for row, column in pairs]
+    return sorted(pairs)
+
+
+def _pending_requests():
+    return list(AssistanceRequest.objects.filter(
+        status='pending', accepted_provider__isnull=True
+    ).order_by('created_at').values('id', 'service_type', 'latitude', 'longitude'))
+
+
+def _idle_provider_queryset():
+    busy = AssistanceRequest.objects.filter(
+        status__in=OPEN_STATUSES, accepted_provider__isnull=False
+    ).values('accepted_provider_id')
+    return ServiceProvider.objects.filter(is_available=True, is_verified=True).exclude(id__in=busy)
+
+
+def _idle_providers():
+    """Available providers without an open job, with their service names"""
+    return attach_service_names(list(_idle_provider_queryset().values('id', 'latitude', 'longitude')))
+
+
+def build_costs(requests, providers, max_distance_km=None):
+    """ETA cost matrix (requests x providers), INFEASIBLE for incompatible or distant pairs"""
+    max_distance_km = get_max_dispatch_km() if max_distance_km is None else max_distance_km
+    lats = np.array([provider['latitude'] for provider in providers], dtype=np.float64)
+    lons = np.array([provider['longitude'] for provider in providers], dtype=np.float64)
+
+    # One compatibility mask per requested category rather than per request
+    masks = {}
+    for request in requests:
+        name = request['service_type']
+        if name not in masks:
+            masks[name] = np.array([name in provider['services'] for provider in providers], dtype=bool)
+
+    cost = np.full((len(requests), len(providers)), INFEASIBLE)
+    for i, request in enumerate(requests):
+        distances = calculate_distances(request['latitude'], request['longitude'], lats, lons)
+        feasible = masks[request['service_type']] & (distances <= max_distance_km)
+        if feasible.any():
+            etas = calculate_etas(distances[feasible], lats[feasible], lons[feasible])
+            cost[i, feasible] = etas + distances[feasible] * DISTANCE_TIE_BREAK
+    return cost
+
+
+def plan_dispatch(requests, providers, max_distance_km=None):
+    """Match request rows to provider rows minimising total ETA. Returns [(request_id, provider_id)]"""
+    if not requests or not providers:
+        return []
+    cost = build_costs(requests, providers, max_distance_km)
+
+    # Providers no request can use only slow the solver down
+    usable = np.flatnonzero((cost < INFEASIBLE).any(axis=0))
+    wanted = np.flatnonzero((cost < INFEASIBLE).any(axis=1))
+    if not len(usable) or not len(wanted):
+        return []
+    cost = cost[np.ix_(wanted, usable)]
+
+    return [
+        (requests[wanted[i]]['id'], providers[usable[j]]['id'])
+        for i, j in solve_assignment(cost)
+        if cost[i, j] < INFEASIBLE
+    ]
+
+
+def dispatch_pending(max_distance_km=None):
+    """Assign every unassigned pending request that can be served. Returns the number assigned
+
+    Assigned requests move to accepted, as if the provider had accepted them: the job
+    shows as the provider's current one on their dashboard and the driver's tracking
+    page is updated.
+    """
+    requests = _pending_requests()
+    if not requests:
+        return 0
+    assignments = plan_dispatch(requests, _idle_providers(), max_distance_km)
+    if not assignments:
+        return 0
+
+    with transaction.atomic():
+        # Providers that went offline or took a job since planning are locked out of
+        # this batch along with their requests, which wait for the next run
+        idle = set(_idle_provider_queryset().select_for_update().filter(
+            id__in=[provider_id for _, provider_id in assignments]
+        ).values_list('id', flat=True))
+        assignments = [(request_id, provider_id) for request_id, provider_id in assignments if provider_id in idle]
+
+        # Rows picked up or cancelled meanwhile are skipped
+        assigned = list(AssistanceRequest.objects.select_for_update().filter(
+            id__in=[request_id for request_id, _ in assignments],
+            status='pending', accepted_provider__isnull=True,
+        ).only('id', 'tracking_id', 'service_type', 'created_at', 'latitude', 'longitude'))
+        if assigned:
+            # One UPDATE for the whole batch
+            provider_for = Case(
+                *[When(id=request_id, then=Value(provider_id)) for request_id, provider_id in assignments],
+                output_field=IntegerField(),
+            )
+            AssistanceRequest.objects.filter(id__in=[row.id for row in assigned]).update(
+                accepted_provider_id=provider_for, status='accepted'
+            )
+            for row in assigned:
+                record_transition(row.service_type, row.created_at, 'pending', 'accepted')
+
+    provider_ids = dict(assignments)
+    for row in assigned:
+        row.accepted_provider_id = provider_ids[row.id]
+        row.status = 'accepted'
+        publish_tracking_update(row)
+    logger.info('Dispatched %d of %d pending requests', len(assigned), len(requests))
+    return len(assigned)
@@ -0,0 +1,144 @@
+import csv
+import datetime
+import decimal
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.utils import timezone
+from .models import AssistanceRequest
+
+# Flat history export: one row per request with its driver, provider and review.
+# Rows are read with a chunked iterator and written as they arrive, so memory
+# stays bounded by CHUNK_SIZE / ROW_GROUP_SIZE however many requests there are.
+CHUNK_SIZE = 2000
+ROW_GROUP_SIZE = 10000
+COLUMNS = [
+    ('id', 'id', pa.int64()),
+    ('tracking_id', 'tracking_id', pa.string()),
+    ('created_at', 'created_at', pa.timestamp('us', tz='UTC')),
+    ('completed_at', 'completed_at', pa.timestamp('us', tz='UTC')),
+    ('status', 'status', pa.string()),
+    ('service_type', 'service_type', pa.string()),
+    ('latitude', 'latitude', pa.float64()),
+    ('longitude', 'longitude', pa.float64()),
+    ('estimated_price', 'estimated_price', pa.float64()),
+    ('description', 'description', pa.string()),
+    ('driver_id', 'driver_id', pa.int64()),
+    ('driver_username', 'driver__user__username', pa.string()),
+    ('vehicle_type', 'driver__vehicle_type', pa.string()),
+    ('provider_id', 'accepted_provider_id', pa.int64()),
+    ('provider_company', 'accepted_provider__company_name', pa.string()),
+    ('review_rating', 'review__rating', pa.int64()),
+    ('review_comment', 'review__comment', pa.string()),
+]
+HEADER = [name for name, _, _ in COLUMNS]
+SCHEMA = pa.schema([(name, type_) for name, _, type_ in COLUMNS])
+
+
+def export_rows(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """Tuples in HEADER order, oldest first, optionally limited to created_at dates [since, until]"""
+    requests = AssistanceRequest.objects.all()
+    # Compare against local midnights rather than created_at__date so request_created_idx is used
+    if since is not None:
+        requests = requests.filter(created_at__gte=_start_of_day(since))
+    if until is not None:
+        requests = requests.filter(created_at__lt=_start_of_day(until + datetime.timedelta(days=1)))
+    # values_list joins driver, user, provider and review in the same query
+    rows = requests.order_by('created_at', 'id').values_list(*[field for _, field, _ in COLUMNS])
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield tuple(_plain(value) for value in row)
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _plain(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+class _Echo:
+    """File-like object that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """Encoded CSV lines, header first"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(
+            [value.isoformat() if isinstance(value, datetime.datetime) else value for value in row]
+        ).encode('utf-8')
+
+
+class _Drain:
+    """Write-only sink that gives up its buffered bytes on each take()"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def _row_groups(rows, row_group_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == row_group_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _to_table(batch):
+    columns = list(zip(*batch))
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)], schema=SCHEMA
+    )
+
+
+def write_parquet(rows, sink, row_group_size=ROW_GROUP_SIZE):
+    """Write rows to a path or file as Parquet, one row group per batch. Returns rows written"""
+    written = 0
+    with pq.ParquetWriter(sink, SCHEMA, compression='zstd') as writer:
+        for batch in _row_groups(rows, row_group_size):
+            writer.write_table(_to_table(batch))
+            written += len(batch)
+    return written
+
+
+def iter_parquet(rows, row_group_size=ROW_GROUP_SIZE):
+    """Parquet file bytes, yielded as each row group is written"""
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, SCHEMA, compression='zstd')
+    for batch in _row_groups(rows, row_group_size):
+        writer.write_table(_to_table(batch))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
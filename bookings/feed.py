@@ -0,0 +1,45 @@
+import heapq
+from django.conf import settings
+from maps.geohash import bounding_box
+from maps.utils import calculate_distance
+from .counters import pending_counts
+from .models import AssistanceRequest
+
+
+def get_feed_radius_km():
+    return getattr(settings, 'PROVIDER_FEED_RADIUS_KM', 25)
+
+
+def _category_feed(service_type, latitude, longitude, max_distance_km, limit):
+    """Newest pending requests of one category near a point, walked along request_status_service_idx"""
+    jobs = AssistanceRequest.objects.filter(status='pending', service_type=service_type)
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, max_distance_km)
+    jobs = jobs.filter(latitude__range=(min_lat, max_lat))
+    if min_lon is not None:
+        jobs = jobs.filter(longitude__range=(min_lon, max_lon))
+
+    # The box corners lie outside the radius, so keep reading until enough jobs are close enough
+    nearby = []
+    for job in jobs.select_related('driver').order_by('-created_at').iterator(chunk_size=limit * 2):
+        job.distance = round(calculate_distance(latitude, longitude, job.latitude, job.longitude), 2)
+        if job.distance <= max_distance_km:
+            nearby.append(job)
+            if len(nearby) == limit:
+                break
+    return nearby
+
+
+def pending_job_feed(provider, limit=10, max_distance_km=None, service_types=None):
+    """Newest pending requests the provider can serve within max_distance_km, each with a .distance
+
+    service_types defaults to the provider's service names. Returns (jobs, pending count across them).
+    """
+    max_distance_km = get_feed_radius_km() if max_distance_km is None else max_distance_km
+    if service_types is None:
+        service_types = list(provider.services.values_list('name', flat=True))
+    feeds = [
+        _category_feed(service_type, provider.latitude, provider.longitude, max_distance_km, limit)
+        for service_type in service_types
+    ]
+    jobs = list(heapq.merge(*feeds, key=lambda job: job.created_at, reverse=True))[:limit]
+    return jobs, sum(pending_counts(service_types).values())
@@ -0,0 +1,25 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bookings.dispatch import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = 'Assign pending requests without a provider to idle providers, minimising total ETA'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-distance', type=float, default=None, help='Never dispatch providers further than this many km')
+        parser.add_argument('--loop', action='store_true', help='Keep running, dispatching the requests collected every window')
+        parser.add_argument('--window', type=float, default=None, help='Seconds between dispatch rounds (defaults to DISPATCH_WINDOW_SECONDS)')
+
+    def handle(self, *args, **options):
+        window = options['window'] or getattr(settings, 'DISPATCH_WINDOW_SECONDS', 5)
+        while True:
+            started = time.perf_counter()
+            assigned = dispatch_pending(options['max_distance'])
+            elapsed = time.perf_counter() - started
+            if assigned or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Dispatched {assigned} requests in {elapsed * 1000:.0f} ms.'))
+            if not options['loop']:
+                break
+            time.sleep(max(window - elapsed, 0))
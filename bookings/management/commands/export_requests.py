@@ -0,0 +1,41 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from bookings.export import export_rows, iter_csv, write_parquet
+
+
+class Command(BaseCommand):
+    help = 'Export assistance request history with driver, provider and review details as CSV or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+        parser.add_argument('--output', help='File to write (CSV defaults to stdout, required for Parquet)')
+        parser.add_argument('--since', help='Only requests created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Only requests created on or before this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('since', 'until'):
+            if options[name]:
+                try:
+                    dates[name] = parse_date(options[name])
+                except ValueError:
+                    dates[name] = None
+                if dates[name] is None:
+                    raise CommandError(f'--{name} must be a YYYY-MM-DD date.')
+        rows = export_rows(**dates)
+
+        if options['format'] == 'parquet':
+            if not options['output']:
+                raise CommandError('--output is required for Parquet exports.')
+            written = write_parquet(rows, options['output'])
+            self.stderr.write(self.style.SUCCESS(f'Wrote {written} requests to {options["output"]}'))
+            return
+
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for line in iter_csv(rows):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bookings.counters import rebuild_rollups
+from communication.counters import rebuild_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the request rollups, account totals and unread message counters from scratch, correcting any drift'
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {count} requests.'))
+        users = rebuild_unread_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt unread counters for {users} users.'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='providerlocation',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
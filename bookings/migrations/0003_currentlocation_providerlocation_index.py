@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_providerlocation_timestamp_default'),
+        ('users', '0003_serviceprovider_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrentLocation',
+            fields=[
+                ('assistance_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_location', serialize=False, to='bookings.assistancerequest')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+                ('speed', models.FloatField(blank=True, null=True)),
+                ('heading', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='providerlocation',
+            index=models.Index(fields=['assistance_request', 'timestamp'], name='providerloc_request_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='currentlocation',
+            name='provider',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.serviceprovider'),
+        ),
+    ]
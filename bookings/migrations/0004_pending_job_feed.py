@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_currentlocation_providerlocation_index'),
+        ('users', '0003_serviceprovider_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assistancerequest',
+            index=models.Index(fields=['status', 'service_type', 'created_at'], name='request_status_service_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:53
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    AssistanceRequest = apps.get_model('bookings', 'AssistanceRequest')
+    RequestRollup = apps.get_model('bookings', 'RequestRollup')
+    DailyRequestRollup = apps.get_model('bookings', 'DailyRequestRollup')
+    PlatformTotal = apps.get_model('bookings', 'PlatformTotal')
+    requests = AssistanceRequest.objects.order_by()
+    RequestRollup.objects.bulk_create([
+        RequestRollup(**row) for row in requests.values('service_type', 'status').annotate(count=Count('id'))
+    ])
+    DailyRequestRollup.objects.bulk_create([
+        DailyRequestRollup(**row)
+        for row in requests.annotate(day=TruncDate('created_at')).values('day', 'service_type', 'status').annotate(count=Count('id'))
+    ], batch_size=500)
+    PlatformTotal.objects.bulk_create([
+        PlatformTotal(name='drivers', count=apps.get_model('users', 'Driver').objects.count()),
+        PlatformTotal(name='providers', count=apps.get_model('users', 'ServiceProvider').objects.count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_pending_job_feed'),
+        ('users', '0003_serviceprovider_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('service_type', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlatformTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrequestrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'service_type', 'status', 'shard'), name='unique_daily_request_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='requestrollup',
+            constraint=models.UniqueConstraint(fields=('service_type', 'status', 'shard'), name='unique_request_rollup'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_request_rollups'),
+        ('users', '0003_serviceprovider_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assistancerequest',
+            index=models.Index(fields=['created_at', 'id'], name='request_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assistancerequest',
+            index=models.Index(fields=['driver', 'created_at', 'id'], name='request_driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assistancerequest',
+            index=models.Index(fields=['accepted_provider', 'created_at', 'id'], name='request_provider_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assistancerequest',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='request_status_created_idx'),
+        ),
+    ]
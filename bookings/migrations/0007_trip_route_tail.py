@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_request_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triptracking',
+            name='route_anchor',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='triptracking',
+            name='route_fixed_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_trip_route_tail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triptracking',
+            name='route_last_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
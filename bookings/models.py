@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 from users.models import Driver, ServiceProvider
 
@@ -23,9 +24,63 @@ class AssistanceRequest(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     tracking_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     
+    class Meta:
+        indexes = [
+            # Pending-job feeds: newest pending requests of one category
+            models.Index(fields=['status', 'service_type', 'created_at'], name='request_status_service_idx'),
+            # Keyset pagination of request lists on (created_at, id), overall and per owner/status
+            models.Index(fields=['created_at', 'id'], name='request_created_idx'),
+            models.Index(fields=['driver', 'created_at', 'id'], name='request_driver_created_idx'),
+            models.Index(fields=['accepted_provider', 'created_at', 'id'], name='request_provider_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='request_status_created_idx'),
+        ]
+    
     def __str__(self):
         return f"Request #{self.id} - {self.driver.user.username}"
 
+class RequestRollup(models.Model):
+    """Number of requests per service category and status, kept current on create and status change
+
+    Each count is spread over a few shard rows so concurrent transitions rarely wait on the
+    same row; readers sum them, see bookings.counters.
+    """
+    service_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service_type', 'status', 'shard'], name='unique_request_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.service_type}/{self.status}: {self.count}"
+
+class DailyRequestRollup(models.Model):
+    """Like RequestRollup, split by the local date each request was created"""
+    day = models.DateField()
+    service_type = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'service_type', 'status', 'shard'], name='unique_daily_request_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.service_type}/{self.status}: {self.count}"
+
+class PlatformTotal(models.Model):
+    """Running totals of registered accounts ('drivers', 'providers')"""
+    name = models.CharField(max_length=20, unique=True)
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.count}"
+
 class Review(models.Model):
     booking = models.OneToOneField(AssistanceRequest, on_delete=models.CASCADE)
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
@@ -41,16 +96,32 @@ class ProviderLocation(models.Model):
     assistance_request = models.ForeignKey(AssistanceRequest, on_delete=models.CASCADE)
     latitude = models.FloatField()
     longitude = models.FloatField()
-    timestamp = models.DateTimeField(auto_now=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Set when the ping is received, not when it is written
     speed = models.FloatField(null=True, blank=True)  # km/h
     heading = models.FloatField(null=True, blank=True)  # degrees
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['assistance_request', 'timestamp'], name='providerloc_request_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.provider.company_name} - {self.timestamp}"
 
+class CurrentLocation(models.Model):
+    """Latest known provider position for a request, kept up to date by location ingestion"""
+    assistance_request = models.OneToOneField(AssistanceRequest, on_delete=models.CASCADE, primary_key=True, related_name='current_location')
+    provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField()
+    speed = models.FloatField(null=True, blank=True)  # km/h
+    heading = models.FloatField(null=True, blank=True)  # degrees
+    
+    def __str__(self):
+        return f"Request #{self.assistance_request_id} @ {self.latitude}, {self.longitude}"
+
 class TripTracking(models.Model):
     """Track the entire trip progress"""
     assistance_request = models.OneToOneField(AssistanceRequest, on_delete=models.CASCADE)
@@ -62,6 +133,14 @@ class TripTracking(models.Model):
     estimated_arrival = models.DateTimeField(null=True, blank=True)
     actual_arrival = models.DateTimeField(null=True, blank=True)
     route_polyline = models.TextField(blank=True)  # Store route coordinates
+    # route_polyline is a settled prefix followed by a short tail that the next batch
+    # re-simplifies: route_fixed_length is the prefix's length in characters and
+    # route_anchor its last point, encoded on its own. See maps.tracking.extend_trip_trails
+    route_fixed_length = models.PositiveIntegerField(default=0)
+    route_anchor = models.CharField(max_length=32, blank=True)
+    # Timestamp of the route's newest point; later batches skip anything not newer, since
+    # it would land after the settled anchor or the tail instead of in its place in time
+    route_last_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
         return f"Trip #{self.assistance_request.id}"
\ No newline at end of file
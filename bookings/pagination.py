@@ -0,0 +1,62 @@
+import datetime
+import heapq
+from django.db.models import Q
+from django.shortcuts import render
+
+# Keyset (seek) pagination over requests, newest first. The cursor is the
+# (created_at, id) of the last row shown, so every page is one index range scan.
+PAGE_SIZE = 25
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(row):
+    microseconds = (row.created_at - EPOCH) // datetime.timedelta(microseconds=1)
+    return f'{microseconds}-{row.id}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor string, raises ValueError when malformed"""
+    microseconds, _, row_id = cursor.partition('-')
+    return EPOCH + datetime.timedelta(microseconds=int(microseconds)), int(row_id)
+
+
+def _seek(queryset, position, page_size):
+    if position is not None:
+        created_at, row_id = position
+        # The redundant created_at__lte bound gives the planner an index range to seek to
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(id__lt=row_id)
+        )
+    return list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+
+
+def keyset_page(querysets, cursor=None, page_size=PAGE_SIZE):
+    """One page of requests after cursor, newest first. Returns (rows, next cursor or None)
+
+    querysets may be a list; each is read separately and merged, which keeps a
+    filter such as status__in=[...] on its own index range per value. A malformed
+    cursor restarts from the newest page.
+    """
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except (ValueError, OverflowError):
+        position = None
+
+    pages = [_seek(queryset, position, page_size) for queryset in querysets]
+    rows = list(heapq.merge(*pages, key=lambda row: (row.created_at, row.id), reverse=True))
+    page = rows[:page_size]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > page_size else None
+    return page, next_cursor
+
+
+def render_page(request, template, querysets):
+    """Render one page of requests as requests/next_cursor/is_first_page, following ?cursor="""
+    requests, next_cursor = keyset_page(querysets, request.GET.get('cursor'))
+    context = {
+        'requests': requests,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, template, context)
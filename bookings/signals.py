@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from users.models import Driver, ServiceProvider
+from . import counters
+from .models import AssistanceRequest
+
+
+@receiver(pre_save, sender=AssistanceRequest)
+def request_saving(sender, instance, **kwargs):
+    # Remember the stored state so the rollups can follow the change
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (
+            AssistanceRequest.objects.filter(pk=instance.pk).values_list('status', 'service_type').first()
+        )
+
+
+@receiver(post_save, sender=AssistanceRequest)
+def request_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if previous is None:
+        counters.record_transition(instance.service_type, instance.created_at, new_status=instance.status)
+    elif previous[1] != instance.service_type:
+        counters.record_transition(previous[1], instance.created_at, old_status=previous[0])
+        counters.record_transition(instance.service_type, instance.created_at, new_status=instance.status)
+    else:
+        counters.record_transition(instance.service_type, instance.created_at, previous[0], instance.status)
+
+
+@receiver(post_delete, sender=AssistanceRequest)
+def request_deleted(sender, instance, **kwargs):
+    counters.record_transition(instance.service_type, instance.created_at, old_status=instance.status)
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_save, sender=ServiceProvider)
+def account_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust_total(_total_name(sender), 1)
+
+
+@receiver(post_delete, sender=Driver)
+@receiver(post_delete, sender=ServiceProvider)
+def account_deleted(sender, instance, **kwargs):
+    counters.adjust_total(_total_name(sender), -1)
+
+
+def _total_name(sender):
+    return 'drivers' if sender is Driver else 'providers'
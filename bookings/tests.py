@@ -0,0 +1,250 @@
+import itertools
+import threading
+from unittest import mock
+import numpy as np
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from bookings.counters import pending_counts, rebuild_rollups, request_stats
+from bookings.dispatch import INFEASIBLE, dispatch_pending, plan_dispatch, solve_assignment
+from bookings.feed import pending_job_feed
+from bookings.models import AssistanceRequest
+from services.models import ServiceCategory
+from users.models import Driver, ServiceProvider, User
+
+PARALLEL_PROVIDERS = 8
+
+
+def create_provider(index):
+    user = User.objects.create_user(username=f'provider{index}', password='pass', user_type='provider')
+    ServiceProvider.objects.create(
+        user=user,
+        company_name=f'Provider {index}',
+        latitude=5.6037,
+        longitude=-0.1870,
+        address='Accra',
+        phone='0200000000',
+        is_verified=True,
+    )
+    return user
+
+
+def create_request(service_type='towing', latitude=5.6037, longitude=-0.1870):
+    user = User.objects.create_user(username=f'driver{User.objects.count()}', password='pass')
+    driver = Driver.objects.create(user=user, vehicle_type='Sedan', license_plate='GR-1234-20')
+    return AssistanceRequest.objects.create(driver=driver, service_type=service_type, latitude=latitude, longitude=longitude)
+
+
+class RequestTransitionTests(TestCase):
+    def setUp(self):
+        self.provider_user = create_provider(0)
+        self.assistance_request = create_request()
+        self.client.force_login(self.provider_user)
+
+    def test_accept_writes_only_changed_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('bookings:accept_request', args=[self.assistance_request.id]))
+        updates = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "bookings_assistancerequest"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" = ', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertIn('"status" = \'pending\'', updates[0])
+
+    def test_second_accept_loses(self):
+        other_user = create_provider(1)
+        self.client.get(reverse('bookings:accept_request', args=[self.assistance_request.id]))
+        self.client.force_login(other_user)
+        self.client.get(reverse('bookings:accept_request', args=[self.assistance_request.id]))
+
+        self.assistance_request.refresh_from_db()
+        self.assertEqual(self.assistance_request.status, 'accepted')
+        self.assertEqual(self.assistance_request.accepted_provider.user, self.provider_user)
+
+    def test_full_lifecycle(self):
+        url_args = [self.assistance_request.id]
+        self.client.get(reverse('bookings:accept_request', args=url_args))
+        self.client.get(reverse('bookings:start_service', args=url_args))
+        self.assistance_request.refresh_from_db()
+        self.assertEqual(self.assistance_request.status, 'in_progress')
+
+        self.client.get(reverse('bookings:complete_service', args=url_args))
+        self.assistance_request.refresh_from_db()
+        self.assertEqual(self.assistance_request.status, 'completed')
+        self.assertIsNotNone(self.assistance_request.completed_at)
+
+        # A finished request cannot be cancelled or restarted
+        self.client.force_login(self.assistance_request.driver.user)
+        self.client.get(reverse('bookings:cancel_request', args=url_args))
+        self.client.force_login(self.provider_user)
+        self.client.get(reverse('bookings:start_service', args=url_args))
+        self.assistance_request.refresh_from_db()
+        self.assertEqual(self.assistance_request.status, 'completed')
+
+
+class PendingJobFeedTests(TestCase):
+    def setUp(self):
+        self.provider_user = create_provider(0)
+        self.provider = self.provider_user.serviceprovider
+        self.provider.services.set([ServiceCategory.objects.get_or_create(name='towing')[0]])
+
+    def test_counters_follow_transitions(self):
+        accepted = create_request()
+        cancelled = create_request()
+        create_request('mechanic')
+        self.assertEqual(pending_counts(), {'towing': 2, 'mechanic': 1})
+
+        self.client.force_login(self.provider_user)
+        self.client.get(reverse('bookings:accept_request', args=[accepted.id]))
+        self.client.force_login(cancelled.driver.user)
+        self.client.get(reverse('bookings:cancel_request', args=[cancelled.id]))
+        self.assertEqual(pending_counts(), {'towing': 0, 'mechanic': 1})
+
+        # Plain saves and deletes are tracked through signals
+        accepted.refresh_from_db()
+        accepted.status = 'pending'
+        accepted.save()
+        AssistanceRequest.objects.get(service_type='mechanic').delete()
+        self.assertEqual(pending_counts(), {'towing': 1, 'mechanic': 0})
+
+    def test_rollups_match_rebuild(self):
+        first = create_request()
+        create_request('mechanic')
+        self.client.force_login(self.provider_user)
+        self.client.get(reverse('bookings:accept_request', args=[first.id]))
+        self.client.get(reverse('bookings:start_service', args=[first.id]))
+        self.client.get(reverse('bookings:complete_service', args=[first.id]))
+
+        def snapshot():
+            stats = request_stats()
+            return (
+                stats['total_requests'], stats['total_drivers'], stats['total_providers'],
+                list(stats['service_stats']), list(stats['status_stats']),
+            )
+        maintained = snapshot()
+        self.assertEqual(maintained[:3], (2, 2, 1))
+        self.assertEqual(maintained[4], [{'status': 'completed', 'count': 1}, {'status': 'pending', 'count': 1}])
+        rebuild_rollups()
+        self.assertEqual(snapshot(), maintained)
+
+    def test_feed_matches_category_and_distance(self):
+        near = create_request()
+        create_request(latitude=6.7)  # ~120km away
+        create_request('mechanic')
+
+        jobs, pending = pending_job_feed(self.provider, limit=5)
+        self.assertEqual([job.id for job in jobs], [near.id])
+        self.assertEqual(jobs[0].distance, 0)
+        self.assertEqual(pending, 2)
+
+
+@override_settings(ETA_PROFILE_PATH=None)
+class DispatchTests(TestCase):
+    def test_assignment_matches_brute_force(self):
+        rng = np.random.default_rng(5)
+        for _ in range(200):
+            rows, columns = (int(size) for size in rng.integers(1, 7, 2))
+            cost = rng.integers(0, 20, (rows, columns)).astype(float)
+            cost[rng.random((rows, columns)) < 0.2] = INFEASIBLE
+
+            pairs = solve_assignment(cost)
+            self.assertEqual(len(pairs), min(rows, columns))
+            self.assertEqual(len({row for row, _ in pairs}), len(pairs))
+            self.assertEqual(len({column for _, column in pairs}), len(pairs))
+            if rows <= columns:
+                best = min(sum(cost[i, j] for i, j in enumerate(perm)) for perm in itertools.permutations(range(columns), rows))
+            else:
+                best = min(sum(cost[i, j] for j, i in enumerate(perm)) for perm in itertools.permutations(range(rows), columns))
+            self.assertEqual(sum(cost[i, j] for i, j in pairs), best)
+
+    def test_dispatch_accepts_on_behalf_of_providers(self):
+        towing = ServiceCategory.objects.get_or_create(name='towing')[0]
+        for index in range(2):
+            create_provider(index).serviceprovider.services.set([towing])
+        near = create_request(latitude=5.61)
+        far = create_request(latitude=5.65)
+        out_of_reach = create_request(latitude=6.7)
+        self.assertEqual(pending_counts(), {'towing': 3})
+
+        with mock.patch('bookings.dispatch.publish_tracking_update') as publish:
+            self.assertEqual(dispatch_pending(max_distance_km=30), 2)
+        self.assertEqual(sorted(call.args[0].id for call in publish.call_args_list), [near.id, far.id])
+
+        for assistance_request in (near, far):
+            assistance_request.refresh_from_db()
+            self.assertEqual(assistance_request.status, 'accepted')
+            self.assertIsNotNone(assistance_request.accepted_provider_id)
+        self.assertNotEqual(near.accepted_provider_id, far.accepted_provider_id)
+        out_of_reach.refresh_from_db()
+        self.assertEqual((out_of_reach.status, out_of_reach.accepted_provider_id), ('pending', None))
+
+        self.assertEqual(pending_counts(), {'towing': 1})
+        maintained = list(request_stats()['status_stats'])
+        rebuild_rollups()
+        self.assertEqual(list(request_stats()['status_stats']), maintained)
+        # Both providers now have an open job
+        self.assertEqual(dispatch_pending(max_distance_km=500), 0)
+
+    def test_providers_busy_since_planning_are_skipped(self):
+        towing = ServiceCategory.objects.get_or_create(name='towing')[0]
+        providers = [create_provider(index).serviceprovider for index in range(2)]
+        for provider in providers:
+            provider.services.set([towing])
+        near = create_request(latitude=5.61)
+        far = create_request(latitude=5.65)
+
+        def plan_then_take_a_job(*args):
+            # The first provider accepts a job by hand while the solver runs
+            assignments = plan_dispatch(*args)
+            job = create_request()
+            AssistanceRequest.objects.filter(id=job.id).update(accepted_provider=providers[0], status='accepted')
+            return assignments
+
+        with mock.patch('bookings.dispatch.plan_dispatch', side_effect=plan_then_take_a_job), \
+                mock.patch('bookings.dispatch.publish_tracking_update'):
+            self.assertEqual(dispatch_pending(max_distance_km=30), 1)
+
+        assigned = AssistanceRequest.objects.get(id__in=[near.id, far.id], status='accepted')
+        self.assertEqual(assigned.accepted_provider_id, providers[1].id)
+        self.assertEqual(AssistanceRequest.objects.filter(accepted_provider=providers[0]).count(), 1)
+
+
+class ConcurrentAcceptTests(TransactionTestCase):
+    def test_parallel_accepts_have_one_winner(self):
+        users = [create_provider(i) for i in range(PARALLEL_PROVIDERS)]
+        rounds = 20
+        requests = [create_request() for _ in range(rounds)]
+        barrier = threading.Barrier(PARALLEL_PROVIDERS)
+        errors = []
+        # Only a winning accept publishes a tracking update
+        winners = []
+
+        def accept_all(user):
+            client = Client()
+            client.force_login(user)
+            try:
+                for assistance_request in requests:
+                    barrier.wait()
+                    client.get(reverse('bookings:accept_request', args=[assistance_request.id]))
+            except Exception as exc:  # Surface failures from worker threads
+                errors.append(exc)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept_all, args=(user,)) for user in users]
+        with mock.patch('bookings.views.publish_tracking_update', side_effect=winners.append):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(request.id for request in winners), [request.id for request in requests])
+        for assistance_request in requests:
+            assistance_request.refresh_from_db()
+            self.assertEqual(assistance_request.status, 'accepted')
+            self.assertIsNotNone(assistance_request.accepted_provider_id)
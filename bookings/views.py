@@ -3,12 +3,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 import json
 import uuid
-import datetime
+from django.utils import timezone
+from .counters import record_transition
 from .models import AssistanceRequest
 from users.models import ServiceProvider, Driver
 from services.models import ServiceCategory
+from maps.tracking import publish_tracking_update
 
 @csrf_exempt
 @login_required
@@ -23,11 +26,12 @@ def create_assistance_request_api(request):
             description = data.get('description')
 
             # Ensure user is a driver
-            if not hasattr(request.user, 'driver'):
+            if request.role != 'driver':
                 return JsonResponse({'success': False, 'error': 'Only drivers can create assistance requests.'}, status=403)
 
-            driver = request.user.driver
-            service_provider = get_object_or_404(ServiceProvider, id=provider_id)
+            driver = request.profile
+            # Without a chosen provider the request is left for the dispatcher to assign
+            service_provider = get_object_or_404(ServiceProvider, id=provider_id) if provider_id else None
             service_category = get_object_or_404(ServiceCategory, name=service_category_name)
 
             # Create AssistanceRequest
@@ -52,21 +56,39 @@ def create_assistance_request_api(request):
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
     return JsonResponse({'success': False, 'error': 'Invalid request method.'}, status=405)
 
+def _compare_and_set(assistance_request, expected_statuses, conditions=None, **changes):
+    """Apply changes only if the request is still in one of expected_statuses
+
+    Conditional UPDATEs writing just the changed columns, so concurrent transitions
+    cannot both succeed. Each expected status is tried in turn, likeliest first, so the
+    rollups know which status was left. Returns whether this call won.
+    """
+    for status in expected_statuses:
+        with transaction.atomic():
+            updated = AssistanceRequest.objects.filter(
+                id=assistance_request.id, status=status, **(conditions or {})
+            ).update(**changes)
+            if updated:
+                record_transition(assistance_request.service_type, assistance_request.created_at,
+                                  status, changes.get('status', status))
+        if updated:
+            for field, value in changes.items():
+                setattr(assistance_request, field, value)
+            return True
+    return False
+
 @login_required
 def accept_request(request, request_id):
     assistance_request = get_object_or_404(AssistanceRequest, id=request_id)
     
-    if not hasattr(request.user, 'serviceprovider'):
+    if request.role != 'provider':
         messages.error(request, 'Only service providers can accept requests.')
         return redirect('dashboard')
         
-    if assistance_request.status != 'pending':
+    if not _compare_and_set(assistance_request, ['pending'], accepted_provider=request.profile, status='accepted'):
         messages.warning(request, 'This request is no longer pending.')
         return redirect('dashboard')
-        
-    assistance_request.accepted_provider = request.user.serviceprovider
-    assistance_request.status = 'accepted'
-    assistance_request.save()
+    publish_tracking_update(assistance_request)
     
     messages.success(request, f'You have accepted request #{assistance_request.id}.')
     return redirect('dashboard')
@@ -74,13 +96,16 @@ def accept_request(request, request_id):
 @login_required
 def start_service(request, request_id):
     assistance_request = get_object_or_404(AssistanceRequest, id=request_id)
+    provider = request.profile if request.role == 'provider' else None
     
-    if assistance_request.accepted_provider != request.user.serviceprovider:
+    if provider is None or assistance_request.accepted_provider_id != provider.id:
         messages.error(request, 'You are not assigned to this request.')
         return redirect('dashboard')
         
-    assistance_request.status = 'in_progress'
-    assistance_request.save()
+    if not _compare_and_set(assistance_request, ['accepted'], {'accepted_provider': provider}, status='in_progress'):
+        messages.warning(request, 'This request can no longer be started.')
+        return redirect('dashboard')
+    publish_tracking_update(assistance_request)
     
     messages.info(request, f'Service for request #{assistance_request.id} has started.')
     return redirect('dashboard')
@@ -88,14 +113,17 @@ def start_service(request, request_id):
 @login_required
 def complete_service(request, request_id):
     assistance_request = get_object_or_404(AssistanceRequest, id=request_id)
+    provider = request.profile if request.role == 'provider' else None
     
-    if assistance_request.accepted_provider != request.user.serviceprovider:
+    if provider is None or assistance_request.accepted_provider_id != provider.id:
         messages.error(request, 'You are not assigned to this request.')
         return redirect('dashboard')
         
-    assistance_request.status = 'completed'
-    assistance_request.completed_at = datetime.datetime.now()
-    assistance_request.save()
+    if not _compare_and_set(assistance_request, ['in_progress', 'accepted'], {'accepted_provider': provider},
+                            status='completed', completed_at=timezone.now()):
+        messages.warning(request, 'This request can no longer be completed.')
+        return redirect('dashboard')
+    publish_tracking_update(assistance_request)
     
     messages.success(request, f'Service for request #{assistance_request.id} has been completed.')
     return redirect('dashboard')
@@ -104,16 +132,14 @@ def complete_service(request, request_id):
 def cancel_request(request, request_id):
     assistance_request = get_object_or_404(AssistanceRequest, id=request_id)
     
-    if not hasattr(request.user, 'driver') or assistance_request.driver != request.user.driver:
+    if request.role != 'driver' or assistance_request.driver_id != request.profile.id:
         messages.error(request, 'You are not authorized to cancel this request.')
         return redirect('dashboard')
         
-    if assistance_request.status not in ['pending', 'accepted', 'in_progress']:
+    if not _compare_and_set(assistance_request, ['pending', 'accepted', 'in_progress'], status='cancelled'):
         messages.warning(request, 'This request cannot be cancelled.')
         return redirect('dashboard')
-        
-    assistance_request.status = 'cancelled'
-    assistance_request.save()
+    publish_tracking_update(assistance_request)
     
     messages.success(request, f'Request #{assistance_request.id} has been cancelled.')
-    return redirect('dashboard')
\ No newline at end of file
+    return redirect('dashboard')
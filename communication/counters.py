@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from users.models import User
+from .models import Message
+
+
+def adjust_unread(user_id, delta):
+    # Clamp at zero so drift never trips the column's non-negative check
+    User.objects.filter(pk=user_id).update(unread_messages=Greatest(F('unread_messages') + delta, 0))
+
+
+@transaction.atomic
+def mark_read(user, message_ids=None, conversation=None):
+    """Mark the user's unread messages (or just message_ids / one conversation) read in one UPDATE. Returns rows changed"""
+    unread = Message.objects.filter(recipient=user, is_read=False)
+    if message_ids is not None:
+        unread = unread.filter(id__in=message_ids)
+    if conversation is not None:
+        unread = unread.filter(conversation=conversation)
+    # Only rows this UPDATE flipped are subtracted, so concurrent mark-reads cannot double count
+    changed = unread.update(is_read=True)
+    if changed:
+        adjust_unread(user.pk, -changed)
+    return changed
+
+
+@transaction.atomic
+def rebuild_unread_counts():
+    """Recompute every user's unread counter from the messages table"""
+    User.objects.exclude(unread_messages=0).update(unread_messages=0)
+    unread = Message.objects.filter(is_read=False).order_by().values('recipient').annotate(count=Count('id'))
+    for row in unread:
+        User.objects.filter(pk=row['recipient']).update(unread_messages=row['count'])
+    return len(unread)
@@ -4,4 +4,11 @@ from .models import Message
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
-        fields = ['recipient', 'subject', 'body']
\ No newline at end of file
+        fields = ['recipient', 'subject', 'body']
+
+
+class ReplyForm(forms.ModelForm):
+    class Meta:
+        model = Message
+        fields = ['body']
+        widgets = {'body': forms.Textarea(attrs={'rows': 3})}
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_unread_counts(apps, schema_editor):
+    Message = apps.get_model('communication', 'Message')
+    User = apps.get_model('users', 'User')
+    unread = Message.objects.filter(is_read=False).order_by().values('recipient').annotate(count=Count('id'))
+    for row in unread:
+        User.objects.filter(pk=row['recipient']).update(unread_messages=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communication', '0001_initial'),
+        ('users', '0004_user_unread_messages'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['recipient', 'created_at', 'id'], name='message_recipient_created_idx'),
+        ),
+        migrations.RunPython(populate_unread_counts, migrations.RunPython.noop),
+    ]
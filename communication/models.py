@@ -1,13 +1,38 @@
 from django.db import models
 from users.models import User
 
+class Conversation(models.Model):
+    """Message thread between the driver and provider of one assistance request"""
+    assistance_request = models.OneToOneField(
+        'bookings.AssistanceRequest', on_delete=models.CASCADE, related_name='conversation'
+    )
+    # Newest message, kept current on send so thread lists need no per-thread subquery
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Conversation for request #{self.assistance_request_id}'
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='messages'
+    )
     subject = models.CharField(max_length=255)
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a user's inbox on (created_at, id)
+            models.Index(fields=['recipient', 'created_at', 'id'], name='message_recipient_created_idx'),
+            # Opening a thread is one range read over this index
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_thread_created_idx'),
+        ]
+
     def __str__(self):
-        return f'Message from {self.sender} to {self.recipient}: {self.subject}'
\ No newline at end of file
+        return f'Message from {self.sender} to {self.recipient}: {self.subject}'
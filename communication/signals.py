@@ -0,0 +1,28 @@
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import counters
+from .models import Conversation, Message
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if not instance.is_read:
+        counters.adjust_unread(instance.recipient_id, 1)
+    if instance.conversation_id:
+        # Only move the pointer forward, in case a slower send commits after a newer one
+        Conversation.objects.filter(
+            Q(last_message__isnull=True) | Q(last_message_id__lt=instance.pk), pk=instance.conversation_id
+        ).update(last_message=instance)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.adjust_unread(instance.recipient_id, -1)
+    if instance.conversation_id:
+        # Deleting the newest message nulls the pointer; fall back to the next newest
+        latest = Message.objects.filter(conversation_id=instance.conversation_id).order_by('-created_at', '-id').first()
+        Conversation.objects.filter(pk=instance.conversation_id, last_message__isnull=True).update(last_message=latest)
@@ -1,3 +1,140 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from bookings.models import AssistanceRequest
+from communication.counters import mark_read, rebuild_unread_counts
+from communication.models import Conversation, Message
+from users.forms import UserUpdateForm
+from users.models import Driver, ServiceProvider, User
 
-# Create your tests here.
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', password='pass')
+        self.recipient = User.objects.create_user(username='recipient', password='pass', user_type='provider')
+
+    def send(self, count):
+        for i in range(count):
+            Message.objects.create(sender=self.sender, recipient=self.recipient, subject=f'Job {i}', body='Details')
+
+    def unread(self):
+        self.recipient.refresh_from_db()
+        return self.recipient.unread_messages
+
+    def test_counter_follows_send_mark_read_and_delete(self):
+        self.client.force_login(self.sender)
+        self.client.post(reverse('send_message', args=[self.recipient.id]), {
+            'recipient': self.recipient.id, 'subject': 'Hello', 'body': 'On my way',
+        })
+        self.send(3)
+        self.assertEqual(self.unread(), 4)
+
+        first = Message.objects.order_by('id').first()
+        self.assertEqual(mark_read(self.recipient, [first.id]), 1)
+        self.assertEqual(mark_read(self.recipient, [first.id]), 0)
+        self.assertEqual(self.unread(), 3)
+
+        Message.objects.order_by('id').last().delete()
+        self.assertEqual(self.unread(), 2)
+        self.client.force_login(self.recipient)
+        self.client.post(reverse('mark_inbox_read'))
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(Message.objects.filter(is_read=False).exists())
+
+        self.send(2)
+        User.objects.filter(pk=self.recipient.pk).update(unread_messages=99)
+        rebuild_unread_counts()
+        self.assertEqual(self.unread(), 2)
+
+    def test_saving_a_stale_user_keeps_new_messages_counted(self):
+        stale = User.objects.get(pk=self.recipient.pk)
+        self.send(2)
+        form = UserUpdateForm({'first_name': 'Ama', 'email': 'ama@example.com'}, instance=stale)
+        self.assertTrue(form.is_valid())
+        form.save()
+        stale.set_password('new-pass')
+        stale.save()
+        self.assertEqual(self.unread(), 2)
+        self.assertEqual(self.recipient.first_name, 'Ama')
+        self.assertTrue(self.recipient.check_password('new-pass'))
+
+    def test_inbox_pages_cover_every_message_once(self):
+        self.send(60)
+        self.client.force_login(self.recipient)
+        seen, cursor, pages = [], None, 0
+        while True:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('inbox'), {'cursor': cursor} if cursor else {})
+            # Session, user, one page of messages joined to their senders
+            self.assertEqual(len(context.captured_queries), 3)
+            seen += [message.id for message in response.context['inbox_messages']]
+            cursor, pages = response.context['next_cursor'], pages + 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen, list(Message.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        provider_user = User.objects.create_user(username='provider', password='pass', user_type='provider')
+        provider = ServiceProvider.objects.create(
+            user=provider_user, company_name='Provider', latitude=5.6037, longitude=-0.1870,
+            address='Accra', phone='0200000000',
+        )
+        driver_user = User.objects.create_user(username='driver', password='pass')
+        driver = Driver.objects.create(user=driver_user, vehicle_type='Sedan', license_plate='GR-1234-20')
+        self.assistance_request = AssistanceRequest.objects.create(
+            driver=driver, accepted_provider=provider, service_type='towing',
+            latitude=5.6037, longitude=-0.1870, status='accepted',
+        )
+        self.url = reverse('conversation', args=[self.assistance_request.id])
+        self.driver_user, self.provider_user = driver_user, provider_user
+
+    def test_thread_round_trip(self):
+        self.client.force_login(self.driver_user)
+        for body in ('Where are you?', 'Blue sedan by the junction'):
+            self.client.post(self.url, {'body': body})
+        thread = Conversation.objects.get(assistance_request=self.assistance_request)
+        self.assertEqual(thread.last_message.body, 'Blue sedan by the junction')
+        self.provider_user.refresh_from_db()
+        self.assertEqual(self.provider_user.unread_messages, 2)
+
+        self.client.force_login(self.provider_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual([m.body for m in response.context['thread_messages']], ['Blue sedan by the junction', 'Where are you?'])
+        # Both messages are marked read by a single UPDATE
+        read_updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE "communication_message"')]
+        self.assertEqual(len(read_updates), 1)
+        self.provider_user.refresh_from_db()
+        self.assertEqual(self.provider_user.unread_messages, 0)
+        self.assertFalse(thread.messages.filter(is_read=False).exists())
+
+        thread.last_message.delete()
+        thread.refresh_from_db()
+        self.assertEqual(thread.last_message.body, 'Where are you?')
+
+    def test_viewing_creates_nothing_and_prefetch_reads_nothing(self):
+        self.client.force_login(self.provider_user)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context['thread_messages']), [])
+        self.assertFalse(Conversation.objects.exists())
+
+        self.client.force_login(self.driver_user)
+        self.client.post(self.url, {'body': 'Where are you?'})
+        self.client.force_login(self.provider_user)
+        self.client.get(self.url, headers={'Sec-Purpose': 'prefetch'})
+        self.provider_user.refresh_from_db()
+        self.assertEqual(self.provider_user.unread_messages, 1)
+        self.client.get(self.url)
+        self.provider_user.refresh_from_db()
+        self.assertEqual(self.provider_user.unread_messages, 0)
+
+    def test_outsiders_cannot_read_thread(self):
+        outsider = User.objects.create_user(username='outsider', password='pass')
+        self.client.force_login(outsider)
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertFalse(Conversation.objects.exists())
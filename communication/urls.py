@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('inbox/', views.inbox, name='inbox'),
+    path('inbox/read/', views.mark_inbox_read, name='mark_inbox_read'),
     path('send/<int:recipient_id>/', views.send_message, name='send_message'),
-]
\ No newline at end of file
+    path('requests/<int:request_id>/', views.conversation, name='conversation'),
+]
@@ -1,7 +1,13 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import get_object_or_404, render, redirect
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import Message
-from .forms import MessageForm
+from django.db import transaction
+from django.views.decorators.http import require_POST
+from bookings.models import AssistanceRequest
+from bookings.pagination import keyset_page
+from .counters import mark_read
+from .models import Conversation, Message
+from .forms import MessageForm, ReplyForm
 from users.models import User
 
 @login_required
@@ -12,7 +18,9 @@ def send_message(request, recipient_id):
         if form.is_valid():
             message = form.save(commit=False)
             message.sender = request.user
-            message.save()
+            # The recipient's unread counter is bumped by a post_save signal in the same transaction
+            with transaction.atomic():
+                message.save()
             return redirect('inbox')
     else:
         form = MessageForm(initial={'recipient': recipient})
@@ -20,5 +28,87 @@ def send_message(request, recipient_id):
 
 @login_required
 def inbox(request):
-    messages = Message.objects.filter(recipient=request.user).order_by('-created_at')
-    return render(request, 'communication/inbox.html', {'messages': messages})
\ No newline at end of file
+    # Seek pagination over message_recipient_created_idx, see bookings.pagination
+    inbox_messages, next_cursor = keyset_page(
+        Message.objects.filter(recipient=request.user).select_related('sender', 'conversation'), request.GET.get('cursor')
+    )
+    context = {
+        # Not 'messages', which base.html uses for flash messages
+        'inbox_messages': inbox_messages,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'communication/inbox.html', context)
+
+@login_required
+@require_POST
+def mark_inbox_read(request):
+    mark_read(request.user)
+    return redirect('inbox')
+
+
+def _thread_partner(request, assistance_request):
+    """The other participant of the request's thread, or None if request.user is not part of it"""
+    if request.role == 'driver' and assistance_request.driver_id == request.profile.id:
+        provider = assistance_request.accepted_provider
+        return provider.user if provider else None
+    if request.role == 'provider' and assistance_request.accepted_provider_id == request.profile.id:
+        return assistance_request.driver.user
+    return None
+
+def _is_prefetch(request):
+    purpose = request.headers.get('Sec-Purpose') or request.headers.get('Purpose') or ''
+    return 'prefetch' in purpose.lower()
+
+@login_required
+def conversation(request, request_id):
+    assistance_request = get_object_or_404(
+        AssistanceRequest.objects.select_related('driver__user', 'accepted_provider__user', 'conversation'), id=request_id
+    )
+    partner = _thread_partner(request, assistance_request)
+    if partner is None:
+        messages.error(request, 'You are not part of this conversation.')
+        return redirect('dashboard')
+    # The thread row is created by the first message, so viewing an empty one writes nothing
+    try:
+        thread = assistance_request.conversation
+    except Conversation.DoesNotExist:
+        thread = None
+
+    if request.method == 'POST':
+        form = ReplyForm(request.POST)
+        if form.is_valid():
+            message = form.save(commit=False)
+            message.sender = request.user
+            message.recipient = partner
+            message.subject = f'Request #{assistance_request.id}'
+            # Signals bump the partner's unread counter and the thread's last_message pointer
+            with transaction.atomic():
+                if thread is None:
+                    thread, _ = Conversation.objects.get_or_create(assistance_request=assistance_request)
+                message.conversation = thread
+                message.save()
+            return redirect('conversation', request_id=assistance_request.id)
+    else:
+        form = ReplyForm()
+
+    if thread is None:
+        thread_messages, next_cursor = [], None
+    else:
+        # Browser prefetches are not the participant reading the thread
+        if not _is_prefetch(request):
+            # One bulk UPDATE for the read receipts
+            mark_read(request.user, conversation=thread)
+        # One range read of message_thread_created_idx
+        thread_messages, next_cursor = keyset_page(
+            Message.objects.filter(conversation=thread).select_related('sender'), request.GET.get('cursor')
+        )
+    context = {
+        'assistance_request': assistance_request,
+        'partner': partner,
+        'form': form,
+        'thread_messages': thread_messages,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'communication/conversation.html', context)
@@ -0,0 +1,160 @@
+import csv
+import io
+import pyarrow.parquet as pq
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from bookings.models import AssistanceRequest
+from services.models import ServiceCategory
+from users.models import Driver, ServiceProvider, User
+
+
+class DashboardQueryCountTests(TestCase):
+    def setUp(self):
+        self.category = ServiceCategory.objects.get_or_create(name='towing')[0]
+        provider_user = User.objects.create_user(username='provider', password='pass', user_type='provider')
+        self.provider = ServiceProvider.objects.create(
+            user=provider_user,
+            company_name='Provider',
+            latitude=5.6037,
+            longitude=-0.1870,
+            address='Accra',
+            phone='0200000000',
+            is_verified=True,
+        )
+        self.provider.services.set([self.category])
+        driver_user = User.objects.create_user(username='driver', password='pass')
+        self.driver = Driver.objects.create(user=driver_user, vehicle_type='Sedan', license_plate='GR-1234-20')
+
+    def create_requests(self, count):
+        for i in range(count):
+            status = ['pending', 'accepted', 'in_progress', 'completed'][i % 4]
+            AssistanceRequest.objects.create(
+                driver=self.driver,
+                service_type='towing',
+                latitude=5.6037 + i * 0.001,
+                longitude=-0.1870,
+                status=status,
+                accepted_provider=None if status == 'pending' else self.provider,
+            )
+
+    def count_queries(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_driver_dashboard_query_count_is_fixed(self):
+        self.create_requests(4)
+        few, response = self.count_queries(self.driver.user)
+        self.assertEqual(response.context['total_requests'], 4)
+        self.assertEqual(response.context['completed_requests'], 1)
+        self.assertEqual(response.context['active_requests_count'], 3)
+
+        self.create_requests(20)
+        many, response = self.count_queries(self.driver.user)
+        self.assertEqual(response.context['total_requests'], 24)
+        self.assertEqual(few, many)
+        # Session, user joined with its profile, counters, active request, recent requests
+        self.assertEqual(many, 5)
+
+    def test_sessions_from_before_profile_backend_stay_logged_in(self):
+        self.client.force_login(self.driver.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.user, self.driver.user)
+
+    def test_provider_dashboard_query_count_is_fixed(self):
+        self.create_requests(4)
+        few, response = self.count_queries(self.provider.user)
+        self.assertEqual(response.context['total_jobs'], 3)
+        self.assertEqual(response.context['completed_jobs'], 1)
+        self.assertEqual(response.context['pending_jobs_count'], 1)
+
+        self.create_requests(20)
+        many, response = self.count_queries(self.provider.user)
+        self.assertEqual(response.context['total_jobs'], 18)
+        self.assertEqual(few, many)
+        # Session, user joined with its profile, counters, services, feed for one category, pending count, active jobs
+        self.assertEqual(many, 7)
+
+    def test_admin_dashboard_reads_rollups(self):
+        admin = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        self.create_requests(4)
+        few, response = self.count_queries(admin)
+        self.assertEqual(response.context['total_requests'], 4)
+        self.assertEqual(response.context['active_requests_count'], 3)
+
+        self.create_requests(20)
+        many, response = self.count_queries(admin)
+        self.assertEqual(response.context['total_requests'], 24)
+        self.assertEqual(response.context['total_drivers'], 1)
+        self.assertEqual(response.context['total_providers'], 1)
+        self.assertEqual(few, many)
+
+
+class RequestHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        driver_user = User.objects.create_user(username='driver', password='pass')
+        driver = Driver.objects.create(user=driver_user, vehicle_type='Sedan', license_plate='GR-1234-20')
+        AssistanceRequest.objects.bulk_create([
+            AssistanceRequest(driver=driver, service_type='towing', latitude=5.6037, longitude=-0.1870,
+                              status='pending' if i % 2 else 'completed')
+            for i in range(60)
+        ])
+        self.client.force_login(self.admin)
+
+    def walk(self, url_name):
+        seen, cursor, query_counts = [], None, set()
+        while True:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse(url_name), {'cursor': cursor} if cursor else {})
+            query_counts.add(len(context.captured_queries))
+            seen.extend(request.id for request in response.context['requests'])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return seen, query_counts
+
+    def test_history_pages_cover_every_request_once(self):
+        seen, query_counts = self.walk('admin_request_history')
+        expected = list(AssistanceRequest.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(query_counts), 1)
+
+    def test_active_pages_merge_statuses(self):
+        seen, _ = self.walk('admin_active_requests')
+        expected = list(AssistanceRequest.objects.filter(status='pending').order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+class RequestExportTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser(username='admin', password='pass', email='admin@example.com')
+        driver_user = User.objects.create_user(username='driver', password='pass')
+        driver = Driver.objects.create(user=driver_user, vehicle_type='Sedan', license_plate='GR-1234-20')
+        for i in range(3):
+            AssistanceRequest.objects.create(driver=driver, service_type='towing', latitude=5.6037, longitude=-0.1870)
+        self.client.force_login(admin)
+
+    def test_csv_export_streams_every_request(self):
+        response = self.client.get(reverse('admin_request_export'))
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['driver_username'], 'driver')
+
+    def test_parquet_export(self):
+        response = self.client.get(reverse('admin_request_export'), {'format': 'parquet'})
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table['service_type'].to_pylist(), ['towing'] * 3)
+
+    def test_malformed_dates_are_rejected(self):
+        for params in ({'since': 'abc'}, {'until': '2024-13-45'}, {'since': '2024-01-01', 'until': 'soon'}):
+            self.assertEqual(self.client.get(reverse('admin_request_export'), params).status_code, 400)
+        response = self.client.get(reverse('admin_request_export'), {'since': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
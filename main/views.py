@@ -1,48 +1,69 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from bookings.counters import daily_stats, request_stats
+from bookings.export import export_rows, iter_csv, iter_parquet
+from bookings.feed import pending_job_feed
 from bookings.models import AssistanceRequest
-from users.models import Driver, ServiceProvider
+from bookings.pagination import keyset_page, render_page
 from django.db.models import Count, Q
 
+ACTIVE_STATUSES = ['pending', 'accepted', 'in_progress']
+ADMIN_ACTIVE_PREVIEW = 20
+
 def home(request):
     return render(request, 'home.html')
 
 @login_required
 def dashboard(request):
     context = {}
-    if hasattr(request.user, 'driver'):
+    if request.role == 'driver':
         template = 'dashboard_driver.html'
-        requests = AssistanceRequest.objects.filter(driver=request.user.driver)
+        requests = AssistanceRequest.objects.filter(driver=request.profile)
+        counts = requests.aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            active=Count('id', filter=Q(status__in=ACTIVE_STATUSES)),
+        )
         context = {
-            'total_requests': requests.count(),
-            'completed_requests': requests.filter(status='completed').count(),
-            'active_requests_count': requests.filter(status__in=['pending', 'accepted', 'in_progress']).count(),
-            'active_request': requests.filter(status__in=['pending', 'accepted', 'in_progress']).first(),
-            'recent_requests': requests.order_by('-created_at')[:3],
+            'total_requests': counts['total'],
+            'completed_requests': counts['completed'],
+            'active_requests_count': counts['active'],
+            'active_request': requests.filter(status__in=ACTIVE_STATUSES).select_related('accepted_provider__user').order_by('-created_at').first(),
+            'recent_requests': requests.select_related('accepted_provider').order_by('-created_at')[:3],
         }
-    elif hasattr(request.user, 'serviceprovider'):
+    elif request.role == 'provider':
         template = 'dashboard_provider.html'
-        provider = request.user.serviceprovider
+        provider = request.profile
         jobs = AssistanceRequest.objects.filter(accepted_provider=provider)
+        counts = jobs.aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+        )
+        services = list(provider.services.all())
+        new_requests, pending_jobs_count = pending_job_feed(
+            provider, limit=2, service_types=[service.name for service in services]
+        )
         context = {
-            'total_jobs': jobs.count(),
-            'completed_jobs': jobs.filter(status='completed').count(),
-            'pending_jobs_count': AssistanceRequest.objects.filter(status='pending', service_type=provider.service_type).count(),
+            'total_jobs': counts['total'],
+            'completed_jobs': counts['completed'],
+            'pending_jobs_count': pending_jobs_count,
             'rating': provider.rating,
-            'new_requests': AssistanceRequest.objects.filter(status='pending', service_type=provider.service_type)[:2],
-            'active_jobs': jobs.filter(status__in=['accepted', 'in_progress']),
+            'services': services,
+            'new_requests': new_requests,
+            'active_jobs': jobs.filter(status__in=['accepted', 'in_progress']).select_related('driver__user'),
         }
     elif request.user.is_superuser:
         template = 'dashboard_admin.html'
-        context = {
-            'total_requests': AssistanceRequest.objects.count(),
-            'service_stats': AssistanceRequest.objects.values('service_type').annotate(count=Count('id')),
-            'status_stats': AssistanceRequest.objects.values('status').annotate(count=Count('id')),
-            'total_drivers': Driver.objects.count(),
-            'total_providers': ServiceProvider.objects.count(),
-            'active_requests': AssistanceRequest.objects.filter(status__in=['pending', 'accepted', 'in_progress']).order_by('-created_at'),
-        }
+        # Totals come from the maintained rollups, so the cost does not grow with request history
+        context = request_stats()
+        context['active_requests_count'] = sum(
+            row['count'] for row in context['status_stats'] if row['status'] in ACTIVE_STATUSES
+        )
+        context['daily_stats'] = daily_stats()
+        context['active_requests'] = keyset_page(_active_requests(), page_size=ADMIN_ACTIVE_PREVIEW)[0]
     else:
         template = 'home.html'
     
@@ -50,17 +71,19 @@ def dashboard(request):
 
 
 
+def _active_requests():
+    # One queryset per status so each page reads a single range of request_status_created_idx
+    requests = AssistanceRequest.objects.select_related('driver__user', 'accepted_provider')
+    return [requests.filter(status=status) for status in ACTIVE_STATUSES]
+
 @login_required
 def request_history(request):
-    if not hasattr(request.user, 'driver'):
+    if request.role != 'driver':
         messages.error(request, 'Only drivers can view request history.')
         return redirect('dashboard')
     
-    requests = AssistanceRequest.objects.filter(driver=request.user.driver).order_by('-created_at')
-    context = {
-        'requests': requests,
-    }
-    return render(request, 'request_history.html', context)
+    requests = AssistanceRequest.objects.filter(driver=request.profile).select_related('accepted_provider')
+    return render_page(request, 'request_history.html', requests)
 
 @login_required
 def admin_active_requests(request):
@@ -68,11 +91,7 @@ def admin_active_requests(request):
         messages.error(request, 'You do not have permission to view this page.')
         return redirect('dashboard')
     
-    requests = AssistanceRequest.objects.filter(status__in=['pending', 'accepted', 'in_progress']).order_by('-created_at')
-    context = {
-        'requests': requests,
-    }
-    return render(request, 'admin_active_requests.html', context)
+    return render_page(request, 'admin_active_requests.html', _active_requests())
 
 @login_required
 def admin_request_history(request):
@@ -80,8 +99,34 @@ def admin_request_history(request):
         messages.error(request, 'You do not have permission to view this page.')
         return redirect('dashboard')
     
-    requests = AssistanceRequest.objects.all().order_by('-created_at')
-    context = {
-        'requests': requests,
-    }
-    return render(request, 'admin_request_history.html', context)
\ No newline at end of file
+    requests = AssistanceRequest.objects.select_related('driver__user', 'accepted_provider')
+    return render_page(request, 'admin_request_history.html', requests)
+
+@login_required
+def admin_request_export(request):
+    """Stream the full request history as CSV (default) or Parquet, optionally limited by ?since=&until= dates"""
+    if not request.user.is_superuser:
+        messages.error(request, 'You do not have permission to view this page.')
+        return redirect('dashboard')
+    
+    bounds = []
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        try:
+            # parse_date returns None for text that is not date-shaped at all
+            parsed = parse_date(value) if value else None
+        except ValueError:
+            parsed = None
+        if value and parsed is None:
+            return HttpResponseBadRequest('since and until must be valid YYYY-MM-DD dates')
+        bounds.append(parsed)
+    since, until = bounds
+    rows = export_rows(since, until)
+    if request.GET.get('format') == 'parquet':
+        response = StreamingHttpResponse(iter_parquet(rows), content_type='application/vnd.apache.parquet')
+        filename = 'assistance_requests.parquet'
+    else:
+        response = StreamingHttpResponse(iter_csv(rows), content_type='text/csv')
+        filename = 'assistance_requests.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,200 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from bookings.models import AssistanceRequest, ProviderLocation
+
+# Archived trails live in <LOCATION_ARCHIVE_DIR>/date=YYYY-MM-DD/part-*.parquet. The batch
+# being archived is recorded in _pending.json until its rows are deleted; names starting
+# with _ or . are skipped by pyarrow datasets
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+SCHEMA = pa.schema([
+    ('assistance_request_id', pa.int64()),
+    ('provider_id', pa.int64()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('speed', pa.float64()),
+    ('heading', pa.float64()),
+])
+COLUMNS = [field.name for field in SCHEMA]
+JOURNAL_NAME = '_pending.json'
+
+
+def get_archive_dir():
+    return str(getattr(settings, 'LOCATION_ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'var', 'location_archive')))
+
+
+def downsample(table, interval_seconds):
+    """Keep the first point of every interval per request, plus each request's last point"""
+    if table.num_rows == 0 or not interval_seconds:
+        return table
+
+    table = table.sort_by([('assistance_request_id', 'ascending'), ('timestamp', 'ascending')])
+    requests = table['assistance_request_id'].to_numpy()
+    seconds = table['timestamp'].cast(pa.int64()).to_numpy() // 1_000_000
+    buckets = seconds // interval_seconds
+
+    keep = np.ones(table.num_rows, dtype=bool)
+    same_request = requests[1:] == requests[:-1]
+    keep[1:] = ~same_request | (buckets[1:] != buckets[:-1])
+    # Always keep where the trip ended
+    keep[:-1] |= ~same_request
+    return table.filter(pa.array(keep))
+
+
+def _write_partitions(table, archive_dir, name):
+    """Write one Parquet file per UTC date, returns the files written
+
+    Files are named after the batch and swapped in by rename, so writing the same
+    batch again replaces them instead of adding duplicates.
+    """
+    dates = table['timestamp'].cast(pa.date32())
+    written = []
+    for date in dates.unique().to_pylist():
+        part = table.filter(pc.equal(dates, pa.scalar(date, pa.date32())))
+        directory = os.path.join(archive_dir, f'date={date.isoformat()}')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'part-{name}.parquet')
+        tmp_path = os.path.join(directory, f'.part-{name}.parquet.tmp')
+        pq.write_table(part, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def _write_journal(archive_dir, batch):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, JOURNAL_NAME)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(batch, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_journal(archive_dir):
+    try:
+        with open(os.path.join(archive_dir, JOURNAL_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _archive_batch(batch, archive_dir, interval_seconds):
+    """Write one journalled batch and delete its rows. Returns (rows removed, rows written)"""
+    table = downsample(_load_locations(batch['request_ids']), interval_seconds)
+    # An interrupted run may already have deleted the rows, its files are then complete
+    if table.num_rows:
+        _write_partitions(table, archive_dir, batch['name'])
+    with transaction.atomic():
+        removed = ProviderLocation.objects.filter(assistance_request_id__in=batch['request_ids']).delete()[0]
+    os.remove(os.path.join(archive_dir, JOURNAL_NAME))
+    return removed, table.num_rows
+
+
+def _load_locations(request_ids):
+    rows = ProviderLocation.objects.filter(
+        assistance_request_id__in=request_ids
+    ).order_by().values_list(*COLUMNS)
+    columns = list(zip(*rows.iterator(chunk_size=5000))) or [[] for _ in COLUMNS]
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)],
+        schema=SCHEMA,
+    )
+
+
+def archive_locations(older_than_days=1, interval_seconds=30, batch_size=200, archive_dir=None):
+    """Move location rows of finished trips to Parquet, downsampled, and delete them from the table
+
+    Returns (requests archived, rows removed, rows written). A batch interrupted between
+    writing and deleting is finished first, rewriting the same files.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    finished = AssistanceRequest.objects.filter(
+        status__in=ARCHIVE_STATUSES, created_at__lt=cutoff, providerlocation__isnull=False
+    ).order_by('id').values_list('id', flat=True).distinct()
+
+    archived_requests = removed = written = 0
+    batch = _read_journal(archive_dir)
+    while True:
+        if batch is None:
+            # Archived rows are deleted, so each pass picks up the next batch
+            request_ids = list(finished[:batch_size])
+            if not request_ids:
+                break
+            batch = {'name': f'{request_ids[0]}-{request_ids[-1]}-{timezone.now():%Y%m%d%H%M%S}', 'request_ids': request_ids}
+            _write_journal(archive_dir, batch)
+
+        batch_removed, batch_written = _archive_batch(batch, archive_dir, interval_seconds)
+        removed += batch_removed
+        written += batch_written
+        archived_requests += len(batch['request_ids'])
+        batch = None
+
+    return archived_requests, removed, written
+
+
+def _dataset(archive_dir=None):
+    archive_dir = archive_dir or get_archive_dir()
+    if not os.path.isdir(archive_dir):
+        return None
+    partitioning = ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive')
+    return ds.dataset(archive_dir, format='parquet', partitioning=partitioning)
+
+
+def _trail_filter(start_date=None, end_date=None, request_ids=None):
+    condition = None
+    if start_date is not None:
+        condition = ds.field('date') >= pa.scalar(start_date, pa.date32())
+    if end_date is not None:
+        clause = ds.field('date') <= pa.scalar(end_date, pa.date32())
+        condition = clause if condition is None else condition & clause
+    if request_ids is not None:
+        clause = ds.field('assistance_request_id').isin(list(request_ids))
+        condition = clause if condition is None else condition & clause
+    return condition
+
+
+def load_trails(start_date=None, end_date=None, request_ids=None, archive_dir=None):
+    """Archived points as a pyarrow Table, pruned to the given dates and requests"""
+    dataset = _dataset(archive_dir)
+    if dataset is None:
+        return SCHEMA.empty_table()
+
+    table = dataset.to_table(columns=COLUMNS, filter=_trail_filter(start_date, end_date, request_ids))
+    return table.sort_by([('assistance_request_id', 'ascending'), ('timestamp', 'ascending')])
+
+
+def iter_trail_batches(start_date=None, end_date=None, request_ids=None, columns=None, batch_size=100000, archive_dir=None):
+    """Archived points as pyarrow RecordBatches in no particular order, for scans too large to load at once"""
+    dataset = _dataset(archive_dir)
+    if dataset is None:
+        return
+    yield from dataset.to_batches(
+        columns=columns or COLUMNS, filter=_trail_filter(start_date, end_date, request_ids), batch_size=batch_size
+    )
+
+
+def load_trail(assistance_request, archive_dir=None):
+    """Archived (lat, lon, timestamp) points of one trip, oldest first"""
+    start = assistance_request.created_at.astimezone(datetime.timezone.utc).date()
+    end = (assistance_request.completed_at or timezone.now()).astimezone(datetime.timezone.utc).date()
+    # Points can trail the completion time slightly
+    end += datetime.timedelta(days=1)
+    table = load_trails(start, end, [assistance_request.id], archive_dir)
+    return list(zip(
+        table['latitude'].to_pylist(),
+        table['longitude'].to_pylist(),
+        table['timestamp'].to_pylist(),
+    ))
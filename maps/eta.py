@@ -0,0 +1,124 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+# Speed profile: mean observed provider speed per ~5km grid cell and UTC hour of the week.
+# Keys pack (lat cell, lon cell, hour) into one int64 so lookups are a binary search.
+CELL_DEGREES = 0.05
+HOURS_PER_WEEK = 7 * 24
+LON_CELLS = int(360 / CELL_DEGREES) + 1
+MIN_SAMPLES = 5
+MIN_SPEED_KMH = 3  # Ignore pings from providers standing still
+MAX_SPEED_KMH = 150
+
+
+def get_profile_path():
+    return getattr(settings, 'ETA_PROFILE_PATH', None)
+
+
+def profile_keys(lats, lons, hours):
+    """Vectorized (lat, lon, hour of week) -> int64 profile key"""
+    lat_cells = np.floor((np.asarray(lats, dtype=np.float64) + 90) / CELL_DEGREES).astype(np.int64)
+    lon_cells = np.floor((np.asarray(lons, dtype=np.float64) + 180) / CELL_DEGREES).astype(np.int64)
+    return (lat_cells * LON_CELLS + lon_cells) * HOURS_PER_WEEK + np.asarray(hours, dtype=np.int64)
+
+
+def hour_of_week(when=None):
+    when = (when or timezone.now()).astimezone(datetime.timezone.utc)
+    return when.weekday() * 24 + when.hour
+
+
+def aggregate_samples(lats, lons, timestamps_s, speeds):
+    """Per-key speed sums and sample counts for one batch. Returns (keys, sums, counts)"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    timestamps_s = np.asarray(timestamps_s, dtype=np.int64)
+
+    valid = np.isfinite(speeds) & (speeds >= MIN_SPEED_KMH) & (speeds <= MAX_SPEED_KMH)
+    lats, lons, speeds, timestamps_s = lats[valid], lons[valid], speeds[valid], timestamps_s[valid]
+
+    # 1970-01-01 was a Thursday; shift so Monday 00:00 UTC is hour 0
+    hours = ((timestamps_s // 3600) + 3 * 24) % HOURS_PER_WEEK
+    keys = profile_keys(lats, lons, hours)
+
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=speeds), np.bincount(inverse)
+
+
+def merge_aggregates(*aggregates):
+    """Combine (keys, sums, counts) from several batches"""
+    keys = np.concatenate([a[0] for a in aggregates])
+    sums = np.concatenate([a[1] for a in aggregates])
+    counts = np.concatenate([a[2] for a in aggregates])
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=sums), np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def finalize_profile(keys, sums, counts):
+    """Mean speed per key, dropping keys with too few samples. Returns (keys, speeds, counts)"""
+    enough = counts >= MIN_SAMPLES
+    speeds = sums[enough] / counts[enough]
+    return keys[enough], speeds.astype(np.float32), counts[enough]
+
+
+def save_profile(keys, speeds, counts, path=None):
+    path = path or get_profile_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, keys=keys, speeds=speeds, counts=counts)
+    os.replace(tmp_path, path)
+
+
+class SpeedProfile:
+    def __init__(self, keys, speeds):
+        self.keys = keys
+        self.speeds = speeds
+
+    def lookup(self, lats, lons, hour):
+        """Speeds for each point, NaN where the profile has no data"""
+        keys = profile_keys(lats, lons, np.full(np.shape(lats), hour))
+        index = np.searchsorted(self.keys, keys)
+        index = np.minimum(index, len(self.keys) - 1)
+        found = self.keys[index] == keys if len(self.keys) else np.zeros(np.shape(keys), dtype=bool)
+        result = np.full(np.shape(keys), np.nan)
+        if len(self.keys):
+            result[found] = self.speeds[index[found]]
+        return result
+
+
+_profile = None
+_profile_mtime = None
+_profile_lock = threading.Lock()
+
+
+def get_profile():
+    """The loaded speed profile, reloaded when the file changes, or None"""
+    global _profile, _profile_mtime
+    path = get_profile_path()
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if mtime != _profile_mtime:
+        with _profile_lock:
+            if mtime != _profile_mtime:
+                with np.load(path) as data:
+                    _profile = SpeedProfile(data['keys'], data['speeds'])
+                _profile_mtime = mtime
+    return _profile
+
+
+def profile_speeds(lats, lons, when=None):
+    """Profiled speeds in km/h for origin points, NaN where there is no data"""
+    profile = get_profile()
+    if profile is None:
+        return np.full(np.shape(lats), np.nan)
+    return profile.lookup(lats, lons, hour_of_week(when))
@@ -0,0 +1,182 @@
+import csv
+import functools
+import math
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# Offline reverse geocoding against a gazetteer of named places, either
+#   a CSV with a header row: latitude,longitude,name[,region][,country]
+#   or a GeoNames dump (cities500.txt, allCountries.txt, ...), tab separated without header
+# Places are indexed in a KD-tree over unit-sphere coordinates, so the nearest point by
+# straight-line distance in 3D is also the nearest by great-circle distance.
+EARTH_RADIUS_KM = 6371
+LEAF_SIZE = 16
+CACHE_SIZE = 4096
+COORDINATE_PRECISION = 3  # Lookups are cached per ~100m
+
+
+def get_gazetteer_path():
+    return getattr(settings, 'GEOCODER_GAZETTEER_PATH', None)
+
+
+def _to_xyz(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+class KDTree:
+    """Static KD-tree over 3D points, built once with median splits"""
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = points
+        self.index = np.arange(len(points))
+        # Per node: split dimension (-1 for leaves), split value, children, and index range
+        self.dims, self.splits, self.lefts, self.rights, self.starts, self.ends = [], [], [], [], [], []
+        if len(points):
+            self._build(leaf_size)
+
+    def _add_node(self, start, end):
+        for values, value in ((self.dims, -1), (self.splits, 0.0), (self.lefts, -1), (self.rights, -1)):
+            values.append(value)
+        self.starts.append(start)
+        self.ends.append(end)
+        return len(self.starts) - 1
+
+    def _build(self, leaf_size):
+        stack = [self._add_node(0, len(self.points))]
+        while stack:
+            node = stack.pop()
+            start, end = self.starts[node], self.ends[node]
+            if end - start <= leaf_size:
+                continue
+
+            members = self.index[start:end]
+            coords = self.points[members]
+            dim = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+            mid = (end - start) // 2
+            self.index[start:end] = members[np.argpartition(coords[:, dim], mid)]
+
+            self.dims[node] = dim
+            self.splits[node] = float(self.points[self.index[start + mid], dim])
+            self.lefts[node] = self._add_node(start, start + mid)
+            self.rights[node] = self._add_node(start + mid, end)
+            stack.extend((self.lefts[node], self.rights[node]))
+
+    def nearest(self, point):
+        """(index, chord distance) of the closest point, or (None, inf) for an empty tree"""
+        best_index, best_distance = None, math.inf
+        if not self.starts:
+            return best_index, best_distance
+
+        stack = [(0.0, 0)]
+        while stack:
+            bound, node = stack.pop()
+            if bound >= best_distance:
+                continue
+            dim = self.dims[node]
+            if dim < 0:
+                members = self.index[self.starts[node]:self.ends[node]]
+                distances = np.sqrt(((self.points[members] - point) ** 2).sum(axis=1))
+                i = int(np.argmin(distances))
+                if distances[i] < best_distance:
+                    best_index, best_distance = int(members[i]), float(distances[i])
+                continue
+
+            offset = point[dim] - self.splits[node]
+            near, far = (self.rights[node], self.lefts[node]) if offset >= 0 else (self.lefts[node], self.rights[node])
+            # Visit the near side first, so push it last
+            stack.append((abs(offset), far))
+            stack.append((0.0, near))
+
+        return best_index, best_distance
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield (
+                float(row['latitude']), float(row['longitude']),
+                row['name'], row.get('region') or '', row.get('country') or '',
+            )
+
+
+def _read_geonames(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            # name, latitude, longitude, country code and admin1 code columns
+            yield float(fields[4]), float(fields[5]), fields[1], fields[10], fields[8]
+
+
+class Gazetteer:
+    def __init__(self, path):
+        reader = _read_csv if str(path).endswith('.csv') else _read_geonames
+        lats, lons, self.names = [], [], []
+        for lat, lon, name, region, country in reader(path):
+            lats.append(lat)
+            lons.append(lon)
+            self.names.append((name, region, country))
+        self.lats = np.asarray(lats)
+        self.lons = np.asarray(lons)
+        self.tree = KDTree(_to_xyz(lats, lons))
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, lat, lon):
+        """Closest place as a dict, or None for an empty gazetteer"""
+        index, chord = self.tree.nearest(_to_xyz([lat], [lon])[0])
+        if index is None:
+            return None
+        name, region, country = self.names[index]
+        return {
+            'name': name,
+            'region': region,
+            'country': country,
+            'display_name': ', '.join(part for part in (name, region, country) if part),
+            'latitude': float(self.lats[index]),
+            'longitude': float(self.lons[index]),
+            'distance_km': round(2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0)), 2),
+        }
+
+
+_gazetteer = None
+_gazetteer_mtime = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """The loaded gazetteer, reloaded when the file changes, or None"""
+    global _gazetteer, _gazetteer_mtime
+    path = get_gazetteer_path()
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if mtime != _gazetteer_mtime:
+        with _gazetteer_lock:
+            if mtime != _gazetteer_mtime:
+                _gazetteer = Gazetteer(path)
+                _gazetteer_mtime = mtime
+                _cached_lookup.cache_clear()
+    return _gazetteer
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _cached_lookup(lat, lon):
+    return _gazetteer.nearest(lat, lon)
+
+
+def reverse_geocode(lat, lon):
+    """Nearest named place to a point, or None when no gazetteer is available"""
+    if get_gazetteer() is None:
+        return None
+    place = _cached_lookup(round(lat, COORDINATE_PRECISION), round(lon, COORDINATE_PRECISION))
+    return dict(place) if place else None
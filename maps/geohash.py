@@ -0,0 +1,132 @@
+import math
+
+# Standard geohash base32 alphabet (no a, i, l, o)
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BASE32_INDEX = {c: i for i, c in enumerate(BASE32)}
+
+GEOHASH_PRECISION = 9  # ~5m cells, stored on ServiceProvider
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(geohash)
+
+
+def decode_bounds(geohash):
+    """Return (min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size_degrees(precision):
+    """Return (lat_degrees, lon_degrees) spanned by a cell of this precision"""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def cell_size_km(precision, latitude):
+    """Return the smaller side of a cell, in kilometers, at the given latitude"""
+    lat_deg, lon_deg = cell_size_degrees(precision)
+    height = lat_deg * KM_PER_DEGREE
+    width = lon_deg * KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.0)
+    return min(height, width)
+
+
+def precision_for_radius(radius_km, latitude):
+    """Finest precision whose cells are at least radius_km wide, or None if no cell is big enough"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if cell_size_km(precision, latitude) >= radius_km:
+            return precision
+    return None
+
+
+def neighbors(geohash):
+    """Return the geohash cell plus its 8 surrounding cells at the same precision"""
+    min_lat, min_lon, max_lat, max_lon = decode_bounds(geohash)
+    lat_step = max_lat - min_lat
+    lon_step = max_lon - min_lon
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+
+    cells = []
+    for dlat in (-1, 0, 1):
+        lat = center_lat + dlat * lat_step
+        if lat < -90 or lat > 90:
+            continue
+        for dlon in (-1, 0, 1):
+            lon = center_lon + dlon * lon_step
+            # Wrap around the antimeridian
+            lon = (lon + 180) % 360 - 180
+            cell = encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing a circle, lon range is None near poles/antimeridian"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6 or min_lat <= -90 or max_lat >= 90:
+        return min_lat, max_lat, None, None
+
+    lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+from bookings.models import AssistanceRequest, ProviderLocation
+from .tracking import extend_trip_trails, publish_tracking_update, record_current_locations
+
+logger = logging.getLogger(__name__)
+
+
+class LocationBuffer:
+    """Write-behind buffer for provider GPS pings.
+
+    Points are queued in memory and written with one bulk_create once
+    LOCATION_FLUSH_SIZE points are waiting or the oldest has waited
+    LOCATION_FLUSH_INTERVAL seconds. Pending points are flushed at exit.
+
+    A failed write puts the batch back in the queue; after LOCATION_FLUSH_ATTEMPTS
+    failures in a row the queue is appended to LOCATION_SPILL_PATH instead, to be
+    loaded again with replay_spill().
+    """
+
+    def __init__(self, flush_size=None, flush_interval=None, max_attempts=None):
+        self.flush_size = flush_size or getattr(settings, 'LOCATION_FLUSH_SIZE', 200)
+        self.flush_interval = flush_interval or getattr(settings, 'LOCATION_FLUSH_INTERVAL', 1.0)
+        self.max_attempts = max_attempts or getattr(settings, 'LOCATION_FLUSH_ATTEMPTS', 3)
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = []
+        self.oldest = None
+        self.timer = None
+        self.stopped = threading.Event()
+
+    def add(self, locations):
+        """Queue ProviderLocation instances, flushing inline when the size threshold is hit"""
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.extend(locations)
+            full = len(self.pending) >= self.flush_size
+        self._ensure_timer()
+        if full:
+            self.flush()
+
+    def due(self):
+        with self.lock:
+            return bool(self.pending) and time.monotonic() - self.oldest >= self.flush_interval
+
+    def flush(self):
+        """Write every pending point, returns how many were stored"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                self.oldest = None
+            if not batch:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    ProviderLocation.objects.bulk_create(batch, batch_size=500)
+                    record_current_locations(batch)
+                    extend_trip_trails(batch)
+            except Exception:
+                self._requeue(batch)
+                return 0
+            self.failures = 0
+
+        self._publish({location.assistance_request_id for location in batch})
+        return len(batch)
+
+    def _requeue(self, batch):
+        # The rolled back insert may have assigned ids, so the rows are inserted afresh next time
+        for location in batch:
+            location.pk = None
+            location._state.adding = True
+        self.failures += 1
+        if self.failures >= self.max_attempts:
+            path = spill_locations(batch)
+            logger.exception('Spilled %d provider locations to %s after %d failed writes', len(batch), path, self.failures)
+            self.failures = 0
+            return
+        logger.exception('Failed to save %d provider locations, retrying (attempt %d of %d)',
+                         len(batch), self.failures, self.max_attempts)
+        with self.lock:
+            self.pending[:0] = batch
+            # Wait a full interval before the next attempt
+            self.oldest = time.monotonic()
+
+    def _publish(self, request_ids):
+        for assistance_request in AssistanceRequest.objects.filter(id__in=request_ids):
+            publish_tracking_update(assistance_request)
+
+    def _ensure_timer(self):
+        if self.timer is not None:
+            return
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Thread(target=self._run, name='location-flush', daemon=True)
+                self.timer.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval / 2):
+            if self.due():
+                close_old_connections()
+                self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+
+SPILL_FIELDS = ('provider_id', 'assistance_request_id', 'latitude', 'longitude', 'speed', 'heading')
+
+
+def get_spill_path():
+    return str(getattr(settings, 'LOCATION_SPILL_PATH', os.path.join(settings.BASE_DIR, 'var', 'location_spill.jsonl')))
+
+
+def spill_locations(locations):
+    """Append points that could not be saved to the spill file as JSON lines. Returns the path"""
+    path = get_spill_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for location in locations:
+            row = {field: getattr(location, field) for field in SPILL_FIELDS}
+            row['timestamp'] = location.timestamp.isoformat()
+            f.write(json.dumps(row) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def replay_spill(buffer=None):
+    """Queue spilled points for another write and flush them. Returns how many were replayed"""
+    path = get_spill_path()
+    claimed = f'{path}.{os.getpid()}.replay'
+    try:
+        # Claim the file so points spilled meanwhile go to a fresh one
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return 0
+    with open(claimed, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    locations = [
+        ProviderLocation(timestamp=parse_datetime(row.pop('timestamp')), **row)
+        for row in rows
+    ]
+    buffer = buffer or get_location_buffer()
+    buffer.add(locations)
+    buffer.flush()
+    # A failed flush keeps the points queued or spills them again, so the claimed copy can go
+    os.remove(claimed)
+    return len(locations)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_location_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LocationBuffer()
+                atexit.register(_buffer.stop)
+    return _buffer
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from maps.archive import archive_locations, get_archive_dir
+
+
+class Command(BaseCommand):
+    help = 'Move location history of completed/cancelled trips into date-partitioned Parquet files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=1, help='Only archive trips created at least this many days ago')
+        parser.add_argument('--interval', type=int, default=30, help='Keep at most one point per this many seconds of a trip (0 keeps all)')
+        parser.add_argument('--batch-size', type=int, default=200, help='Trips archived per Parquet write')
+        parser.add_argument('--every', type=int, default=0, help='Keep running and archive again every N minutes')
+
+    def handle(self, *args, **options):
+        while True:
+            requests, removed, written = archive_locations(
+                older_than_days=options['older_than'],
+                interval_seconds=options['interval'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {requests} trips to {get_archive_dir()}: {removed} rows removed, {written} rows written.'
+            ))
+            if not options['every']:
+                break
+            time.sleep(options['every'] * 60)
@@ -0,0 +1,64 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from bookings.models import AssistanceRequest, ProviderLocation
+from maps.ingest import LocationBuffer
+from users.models import Driver, ServiceProvider, User
+
+
+class Command(BaseCommand):
+    help = 'Compare provider location pings per second: one INSERT per ping vs buffered bulk writes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pings', type=int, default=2000, help='Number of pings to write in each mode')
+        parser.add_argument('--batch', type=int, default=200, help='Flush size for the buffered mode')
+
+    def handle(self, *args, **options):
+        pings = options['pings']
+        suffix = uuid.uuid4().hex[:8]
+        driver_user = User.objects.create(username=f'bench-driver-{suffix}')
+        provider_user = User.objects.create(username=f'bench-provider-{suffix}', user_type='provider')
+        try:
+            driver = Driver.objects.create(user=driver_user, vehicle_type='Car', license_plate='BENCH')
+            provider = ServiceProvider.objects.create(
+                user=provider_user, company_name='Benchmark', latitude=5.6037, longitude=-0.1870,
+                address='Accra', phone='0200000000'
+            )
+            assistance_request = AssistanceRequest.objects.create(
+                driver=driver, accepted_provider=provider, service_type='Towing',
+                latitude=5.6037, longitude=-0.1870, status='accepted'
+            )
+            tracking_id = assistance_request.tracking_id
+
+            # Before: lookup plus one INSERT per ping
+            start = time.perf_counter()
+            for i in range(pings):
+                request_row = AssistanceRequest.objects.get(tracking_id=tracking_id)
+                ProviderLocation.objects.create(
+                    provider=request_row.accepted_provider,
+                    assistance_request=request_row,
+                    latitude=5.6037 + i * 1e-5,
+                    longitude=-0.1870
+                )
+            single = pings / (time.perf_counter() - start)
+
+            # After: pings queued in memory and written with bulk_create
+            buffer = LocationBuffer(flush_size=options['batch'], flush_interval=3600)
+            start = time.perf_counter()
+            for i in range(pings):
+                buffer.add([ProviderLocation(
+                    provider_id=provider.id,
+                    assistance_request_id=assistance_request.id,
+                    latitude=5.6037 + i * 1e-5,
+                    longitude=-0.1870
+                )])
+            buffer.stop()
+            buffered = pings / (time.perf_counter() - start)
+
+            self.stdout.write(f'single INSERT per ping: {single:,.0f} pings/s')
+            self.stdout.write(f"buffered (batch {options['batch']}): {buffered:,.0f} pings/s")
+            self.stdout.write(self.style.SUCCESS(f'speedup: {buffered / single:.1f}x'))
+        finally:
+            # Cascades to the benchmark driver, provider, request and locations
+            driver_user.delete()
+            provider_user.delete()
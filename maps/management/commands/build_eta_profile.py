@@ -0,0 +1,62 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from bookings.models import ProviderLocation
+from maps import eta
+from maps.archive import iter_trail_batches
+
+
+class Command(BaseCommand):
+    help = 'Build the per-cell, per-hour-of-week speed profile used for ETAs from location history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100000, help='Location rows aggregated per batch')
+        parser.add_argument('--skip-archive', action='store_true', help='Ignore archived Parquet trails')
+
+    def handle(self, *args, **options):
+        if not eta.get_profile_path():
+            self.stdout.write(self.style.WARNING('ETA_PROFILE_PATH is not set, nothing to build.'))
+            return
+
+        batch_size = options['batch_size']
+        empty = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64))
+        total = empty
+        samples = 0
+
+        rows = ProviderLocation.objects.filter(speed__isnull=False).order_by().values_list(
+            'latitude', 'longitude', 'timestamp', 'speed'
+        ).iterator(chunk_size=batch_size)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                total = eta.merge_aggregates(total, self._aggregate_rows(batch))
+                samples += len(batch)
+                batch = []
+        if batch:
+            total = eta.merge_aggregates(total, self._aggregate_rows(batch))
+            samples += len(batch)
+
+        if not options['skip_archive']:
+            archived = iter_trail_batches(columns=['latitude', 'longitude', 'timestamp', 'speed'], batch_size=batch_size)
+            for archived_batch in archived:
+                if not archived_batch.num_rows:
+                    continue
+                total = eta.merge_aggregates(total, eta.aggregate_samples(
+                    archived_batch['latitude'].to_numpy(),
+                    archived_batch['longitude'].to_numpy(),
+                    archived_batch['timestamp'].cast('int64').to_numpy() // 1_000_000,
+                    archived_batch['speed'].to_numpy(zero_copy_only=False),
+                ))
+                samples += archived_batch.num_rows
+
+        keys, speeds, counts = eta.finalize_profile(*total)
+        eta.save_profile(keys, speeds, counts)
+        self.stdout.write(self.style.SUCCESS(
+            f'Built speed profile from {samples} samples: {len(keys)} cell/hour buckets written to {eta.get_profile_path()}'
+        ))
+
+    def _aggregate_rows(self, rows):
+        lats, lons, timestamps, speeds = zip(*rows)
+        return eta.aggregate_samples(
+            lats, lons, [int(timestamp.timestamp()) for timestamp in timestamps], speeds
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from maps.snapshot import build_snapshot, get_snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the shared memory-mapped snapshot of available providers'
+
+    def handle(self, *args, **options):
+        if not get_snapshot_path():
+            self.stdout.write(self.style.WARNING('PROVIDER_SNAPSHOT_PATH is not set, nothing to build.'))
+            return
+
+        count = build_snapshot()
+        if count is None:
+            self.stdout.write(self.style.WARNING('Too many service categories for the snapshot bitmask.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} providers to {get_snapshot_path()}'))
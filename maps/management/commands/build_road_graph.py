@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from maps.routing import build_graph_from_osm, get_graph_path, save_graph
+
+
+class Command(BaseCommand):
+    help = 'Build the road graph used for driving distances from an OSM XML extract'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help='Path to an .osm XML extract of the service area')
+        parser.add_argument('--output', help='Where to write the graph (defaults to ROAD_GRAPH_PATH)')
+
+    def handle(self, *args, **options):
+        output = options['output'] or get_graph_path()
+        if not output:
+            raise CommandError('ROAD_GRAPH_PATH is not set, pass --output.')
+
+        try:
+            arrays = build_graph_from_osm(options['osm_file'])
+        except (OSError, SyntaxError) as exc:
+            raise CommandError(f'Could not read {options["osm_file"]}: {exc}')
+
+        save_graph(arrays, output)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(arrays["lat"])} nodes and {len(arrays["indices"])} edges to {output}'
+        ))
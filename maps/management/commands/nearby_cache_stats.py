@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from maps import nearby_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts for the nearby-providers response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = nearby_cache.get_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {stats['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            nearby_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from maps.ingest import get_spill_path, replay_spill
+
+
+class Command(BaseCommand):
+    help = 'Write provider locations that were spilled to disk after repeated failed saves'
+
+    def handle(self, *args, **options):
+        count = replay_spill()
+        self.stdout.write(self.style.SUCCESS(f'Replayed {count} locations from {get_spill_path()}.'))
@@ -0,0 +1,104 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from . import geohash
+from .utils import calculate_distance, get_nearby_providers, rank_providers
+
+# Queries are quantized to ~1km cells; the candidate set of a cell is shared by every driver in it
+CELL_PRECISION = 6
+# Provider changes invalidate ~20-40km regions (coarser for wide searches) rather than individual cells
+REGION_PRECISION = 4
+
+EPOCH_KEY = 'nearby:epoch'
+HITS_KEY = 'nearby:hits'
+MISSES_KEY = 'nearby:misses'
+
+
+def _ttl():
+    return getattr(settings, 'NEARBY_CACHE_TTL', 30)
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key missing or evicted, start counting again
+        cache.add(key, 1, timeout=None)
+        return 1
+
+
+def _region_key(cell):
+    return f'nearby:version:{cell}'
+
+
+def _version_keys(center_lat, center_lon, candidate_radius_km):
+    """Version counters whose regions cover every candidate of a cell, or None if no region is wide enough"""
+    precision = geohash.precision_for_radius(candidate_radius_km, center_lat)
+    if precision is None:
+        return None
+    # A 3x3 block of cells at least the candidate radius wide covers the whole search circle
+    region = geohash.encode(center_lat, center_lon, min(precision, REGION_PRECISION))
+    return [_region_key(cell) for cell in geohash.neighbors(region)]
+
+
+def get_candidates(user_lat, user_lon, service_types=None, max_distance_km=10):
+    """Provider rows that may be within max_distance_km of any point in the user's cell"""
+    cell = geohash.encode(user_lat, user_lon, CELL_PRECISION)
+    min_lat, min_lon, max_lat, max_lon = geohash.decode_bounds(cell)
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+    candidate_radius = max_distance_km + calculate_distance(center_lat, center_lon, max_lat, max_lon)
+
+    region_keys = _version_keys(center_lat, center_lon, candidate_radius)
+    if region_keys is None:
+        # Wider than any geohash cell, nothing could invalidate it, so do not cache
+        return get_nearby_providers(center_lat, center_lon, service_types, candidate_radius, rows=True)
+    version_keys = [EPOCH_KEY] + region_keys
+    versions = cache.get_many(version_keys)
+    version = '.'.join(str(versions.get(key, 0)) for key in version_keys)
+    services = ','.join(sorted(service_types or []))
+    digest = hashlib.sha1(f'{services}:{max_distance_km}:{version}'.encode('utf-8')).hexdigest()
+    key = f'nearby:{cell}:{digest}'
+
+    rows = cache.get(key)
+    if rows is not None:
+        _incr(HITS_KEY)
+        return rows
+
+    _incr(MISSES_KEY)
+    rows = get_nearby_providers(center_lat, center_lon, service_types, candidate_radius, rows=True)
+    cache.set(key, rows, _ttl())
+    return rows
+
+
+def get_nearby_provider_rows(user_lat, user_lon, service_types=None, max_distance_km=10):
+    """Cached nearby provider rows with distance and ETA recomputed for this user"""
+    candidates = get_candidates(user_lat, user_lon, service_types, max_distance_km)
+    return rank_providers(candidates, user_lat, user_lon, max_distance_km)
+
+
+def invalidate_location(latitude, longitude):
+    """Expire cached candidate sets that could include a provider at this location"""
+    # One counter per region precision the location falls in; regions elsewhere keep their entries
+    for precision in range(1, REGION_PRECISION + 1):
+        _incr(_region_key(geohash.encode(latitude, longitude, precision)))
+
+
+def invalidate_all():
+    """Expire every cached candidate set"""
+    _incr(EPOCH_KEY)
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
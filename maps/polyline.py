@@ -0,0 +1,112 @@
+import math
+
+# Google encoded polyline format, 5 decimal places
+PRECISION = 1e5
+EARTH_RADIUS_M = 6371000
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode(points, start=None):
+    """Encode a list of (lat, lon) pairs as a polyline string
+
+    Pass the last point of an existing polyline as start to get a string that can
+    be appended to it.
+    """
+    result = []
+    prev_lat = prev_lon = 0
+    if start is not None:
+        prev_lat = int(round(start[0] * PRECISION))
+        prev_lon = int(round(start[1] * PRECISION))
+    for lat, lon in points:
+        lat_e5 = int(round(lat * PRECISION))
+        lon_e5 = int(round(lon * PRECISION))
+        result.append(_encode_value(lat_e5 - prev_lat))
+        result.append(_encode_value(lon_e5 - prev_lon))
+        prev_lat, prev_lon = lat_e5, lon_e5
+    return ''.join(result)
+
+
+def decode(polyline, start=None):
+    """Decode a polyline string into a list of (lat, lon) pairs
+
+    start is the point the string continues from, see encode.
+    """
+    points = []
+    index = 0
+    lat = lon = 0
+    if start is not None:
+        lat = int(round(start[0] * PRECISION))
+        lon = int(round(start[1] * PRECISION))
+    length = len(polyline)
+
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = 0
+            value = 0
+            while True:
+                byte = ord(polyline[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / PRECISION, lon / PRECISION))
+
+    return points
+
+
+def _to_meters(points):
+    # Local equirectangular projection, accurate enough over a single trip
+    ref_lat = math.radians(points[0][0])
+    scale = math.radians(1) * EARTH_RADIUS_M
+    return [(lon * scale * math.cos(ref_lat), lat * scale) for lat, lon in points]
+
+
+def _segment_distance(p, a, b):
+    dx = b[0] - a[0]
+    dy = b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def simplify(points, tolerance_m=10):
+    """Douglas-Peucker simplification of (lat, lon) points, keeping both endpoints"""
+    if len(points) < 3:
+        return list(points)
+
+    projected = _to_meters(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        max_distance = 0.0
+        index = None
+        for i in range(start + 1, end):
+            distance = _segment_distance(projected[i], projected[start], projected[end])
+            if distance > max_distance:
+                max_distance = distance
+                index = i
+        if index is not None and max_distance > tolerance_m:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [point for point, kept in zip(points, keep) if kept]
@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """A single listener on a channel, messages are queued until read"""
+
+    def __init__(self, broker, channel, max_pending=100):
+        self.broker = broker
+        self.channel = channel
+        self.messages = deque(maxlen=max_pending)
+        self.condition = threading.Condition()
+
+    def deliver(self, message):
+        with self.condition:
+            self.messages.append(message)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Next message, or None if nothing arrived within timeout seconds"""
+        with self.condition:
+            if not self.messages:
+                self.condition.wait(timeout)
+            if self.messages:
+                return self.messages.popleft()
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessPubSub:
+    """Pub/sub between threads of one process.
+
+    Only reaches subscribers in the same worker; point TRACKING_PUBSUB_BACKEND
+    at a broker-backed class with the same publish/subscribe/has_subscribers interface to fan
+    out across processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            listeners = self.subscriptions.get(subscription.channel)
+            if listeners is not None:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self.subscriptions[subscription.channel]
+
+    def has_subscribers(self, channel):
+        with self.lock:
+            return bool(self.subscriptions.get(channel))
+
+    def publish(self, channel, message):
+        with self.lock:
+            listeners = list(self.subscriptions.get(channel, ()))
+        for subscription in listeners:
+            subscription.deliver(message)
+        return len(listeners)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'TRACKING_PUBSUB_BACKEND', 'maps.pubsub.InProcessPubSub')
+                _broker = import_string(backend)()
+    return _broker
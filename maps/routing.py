@@ -0,0 +1,300 @@
+import heapq
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+# Road graph stored as CSR arrays (forward and reversed) in ROAD_GRAPH_PATH:
+#   lat, lon               float64[nodes]
+#   indptr, indices, km    forward adjacency: edges of node i are indices[indptr[i]:indptr[i+1]]
+#   rindptr, rindices, rkm the same for the reversed graph, used for many-to-one queries
+ROUTABLE_HIGHWAYS = {
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential',
+    'motorway_link', 'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link',
+    'living_street', 'service', 'road',
+}
+EARTH_RADIUS_KM = 6371
+GRID_DEGREES = 0.01  # ~1km buckets for nearest-node lookups
+MAX_SNAP_KM = 2  # Points further than this from any road are not routed
+CACHE_SIZE = 256
+
+
+def get_graph_path():
+    return getattr(settings, 'ROAD_GRAPH_PATH', None)
+
+
+def _haversine(lat1, lon1, lats, lons):
+    lat1 = math.radians(lat1)
+    lats = np.radians(lats)
+    dlat = lats - lat1
+    dlon = np.radians(lons) - math.radians(lon1)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _edge_lengths(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _to_csr(count, sources, targets, weights):
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=count), out=indptr[1:])
+    return indptr, targets[order].astype(np.int32), weights[order].astype(np.float32)
+
+
+def build_graph_from_osm(osm_path):
+    """Parse an OSM XML extract into CSR arrays of the drivable road network"""
+    node_coords = {}
+    ways = []
+
+    for _, element in ET.iterparse(osm_path, events=('end',)):
+        if element.tag == 'node':
+            node_coords[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+            element.clear()
+        elif element.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in element.findall('tag')}
+            if tags.get('highway') in ROUTABLE_HIGHWAYS:
+                refs = [int(nd.get('ref')) for nd in element.findall('nd')]
+                oneway = tags.get('oneway')
+                if oneway == '-1':
+                    refs.reverse()
+                is_oneway = oneway in ('yes', 'true', '1', '-1') or tags.get('junction') == 'roundabout'
+                ways.append((refs, is_oneway))
+            element.clear()
+
+    # Keep only nodes used by roads, renumbered densely
+    index = {}
+    for refs, _ in ways:
+        for ref in refs:
+            if ref in node_coords and ref not in index:
+                index[ref] = len(index)
+    lat = np.empty(len(index))
+    lon = np.empty(len(index))
+    for ref, i in index.items():
+        lat[i], lon[i] = node_coords[ref]
+
+    sources, targets = [], []
+    for refs, is_oneway in ways:
+        refs = [index[ref] for ref in refs if ref in index]
+        for a, b in zip(refs, refs[1:]):
+            sources.append(a)
+            targets.append(b)
+            if not is_oneway:
+                sources.append(b)
+                targets.append(a)
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    km = _edge_lengths(lat[sources], lon[sources], lat[targets], lon[targets])
+
+    indptr, indices, weights = _to_csr(len(index), sources, targets, km)
+    rindptr, rindices, rweights = _to_csr(len(index), targets, sources, km)
+    return {
+        'lat': lat, 'lon': lon,
+        'indptr': indptr, 'indices': indices, 'km': weights,
+        'rindptr': rindptr, 'rindices': rindices, 'rkm': rweights,
+    }
+
+
+def save_graph(arrays, path=None):
+    path = path or get_graph_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+class RoadGraph:
+    def __init__(self, arrays):
+        self.lat = arrays['lat']
+        self.lon = arrays['lon']
+        self.forward = (arrays['indptr'], arrays['indices'], arrays['km'])
+        self.reverse = (arrays['rindptr'], arrays['rindices'], arrays['rkm'])
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+        # Grid buckets for nearest-node lookups
+        cells = self._cells(self.lat, self.lon)
+        order = np.argsort(cells, kind='stable')
+        self.cell_keys, starts = np.unique(cells[order], return_index=True)
+        self.cell_starts = np.append(starts, len(order))
+        self.cell_nodes = order
+
+    @staticmethod
+    def _cells(lats, lons):
+        rows = np.floor((np.asarray(lats) + 90) / GRID_DEGREES).astype(np.int64)
+        cols = np.floor((np.asarray(lons) + 180) / GRID_DEGREES).astype(np.int64)
+        return rows * 100000 + cols
+
+    def nearest_node(self, lat, lon):
+        """Closest road node within MAX_SNAP_KM, or None"""
+        row = math.floor((lat + 90) / GRID_DEGREES)
+        col = math.floor((lon + 180) / GRID_DEGREES)
+        # Enough cells either side to cover MAX_SNAP_KM, columns narrow towards the poles
+        cell_km = math.radians(GRID_DEGREES) * EARTH_RADIUS_KM
+        rows = math.ceil(MAX_SNAP_KM / cell_km)
+        cols = math.ceil(MAX_SNAP_KM / (cell_km * max(math.cos(math.radians(lat)), 0.01)))
+        candidates = []
+        for dr in range(-rows, rows + 1):
+            for dc in range(-cols, cols + 1):
+                key = (row + dr) * 100000 + col + dc
+                i = np.searchsorted(self.cell_keys, key)
+                if i < len(self.cell_keys) and self.cell_keys[i] == key:
+                    candidates.append(self.cell_nodes[self.cell_starts[i]:self.cell_starts[i + 1]])
+        if not candidates:
+            return None
+        candidates = np.concatenate(candidates)
+        distances = _haversine(lat, lon, self.lat[candidates], self.lon[candidates])
+        best = int(np.argmin(distances))
+        if distances[best] > MAX_SNAP_KM:
+            return None
+        return int(candidates[best])
+
+    def _heuristic(self, node, target):
+        return _haversine(self.lat[target], self.lon[target], self.lat[node:node + 1], self.lon[node:node + 1])[0]
+
+    def shortest_path_km(self, source, target):
+        """A* road distance between two nodes, or None if unreachable"""
+        if source == target:
+            return 0.0
+        key = ('path', source, target)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        indptr, indices, weights = self.forward
+        best = {source: 0.0}
+        heap = [(self._heuristic(source, target), 0.0, source)]
+        result = None
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node == target:
+                result = distance
+                break
+            if distance > best.get(node, math.inf):
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = int(indices[edge])
+                candidate = distance + float(weights[edge])
+                if candidate < best.get(neighbor, math.inf):
+                    best[neighbor] = candidate
+                    heapq.heappush(heap, (candidate + self._heuristic(neighbor, target), candidate, neighbor))
+
+        self._cache_set(key, result)
+        return result
+
+    def distances_to(self, target, max_km):
+        """Road distance from every node within max_km to target (Dijkstra on the reversed graph)"""
+        key = ('to', target, max_km)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        indptr, indices, weights = self.reverse
+        settled = {}
+        heap = [(0.0, target)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = distance
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = int(indices[edge])
+                candidate = distance + float(weights[edge])
+                if neighbor not in settled and candidate <= max_km:
+                    heapq.heappush(heap, (candidate, neighbor))
+
+        self._cache_set(key, settled)
+        return settled
+
+    def _cache_get(self, key):
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        return None
+
+    def _cache_set(self, key, value):
+        with self.cache_lock:
+            self.cache[key] = value
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+
+_graph = None
+_graph_mtime = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    """The loaded road graph, reloaded when the file changes, or None when routing is off"""
+    global _graph, _graph_mtime
+    path = get_graph_path()
+    if not path or getattr(settings, 'DISTANCE_BACKEND', 'haversine') != 'road':
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if mtime != _graph_mtime:
+        with _graph_lock:
+            if mtime != _graph_mtime:
+                with np.load(path) as data:
+                    _graph = RoadGraph({name: data[name] for name in data.files})
+                _graph_mtime = mtime
+    return _graph
+
+
+def road_distance(from_lat, from_lon, to_lat, to_lon):
+    """Driving distance in km between two points, or None when it cannot be routed"""
+    graph = get_graph()
+    if graph is None:
+        return None
+    source = graph.nearest_node(from_lat, from_lon)
+    target = graph.nearest_node(to_lat, to_lon)
+    if source is None or target is None:
+        return None
+    distance = graph.shortest_path_km(source, target)
+    if distance is None:
+        return None
+    # Add the straight legs from the points onto the road network
+    return distance + _snap_km(graph, source, from_lat, from_lon) + _snap_km(graph, target, to_lat, to_lon)
+
+
+def road_distances_to(to_lat, to_lon, lats, lons, max_km):
+    """Driving distances from many origins to one point
+
+    NaN where a point is off the road network, inf where it has no route of at most max_km.
+    """
+    result = np.full(len(lats), np.nan)
+    graph = get_graph()
+    if graph is None:
+        return result
+    target = graph.nearest_node(to_lat, to_lon)
+    if target is None:
+        return result
+
+    # Allow some slack for the legs onto and off the network
+    reachable = graph.distances_to(target, max_km + 2 * MAX_SNAP_KM)
+    target_leg = _snap_km(graph, target, to_lat, to_lon)
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        source = graph.nearest_node(lat, lon)
+        if source is None:
+            continue
+        if source in reachable:
+            distance = reachable[source] + _snap_km(graph, source, lat, lon) + target_leg
+            result[i] = distance if distance <= max_km else np.inf
+        else:
+            result[i] = np.inf
+    return result
+
+
+def _snap_km(graph, node, lat, lon):
+    return float(_haversine(lat, lon, graph.lat[node:node + 1], graph.lon[node:node + 1])[0])
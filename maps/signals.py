@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from users.models import ServiceProvider
+from . import nearby_cache, snapshot
+
+
+def _invalidate_on_commit(*locations):
+    def invalidate():
+        for latitude, longitude in set(locations):
+            nearby_cache.invalidate_location(latitude, longitude)
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=ServiceProvider)
+def provider_saved(sender, instance, **kwargs):
+    transaction.on_commit(snapshot.schedule_rebuild)
+
+    # Expire cached results around the old spot too; loaded_location is recorded by ServiceProvider.from_db
+    locations = [(instance.latitude, instance.longitude)]
+    if None not in instance.loaded_location:
+        locations.append(instance.loaded_location)
+    instance.loaded_location = (instance.latitude, instance.longitude)
+    _invalidate_on_commit(*locations)
+
+
+@receiver(post_delete, sender=ServiceProvider)
+def provider_deleted(sender, instance, **kwargs):
+    transaction.on_commit(snapshot.schedule_rebuild)
+    _invalidate_on_commit((instance.latitude, instance.longitude))
+
+
+@receiver(m2m_changed, sender=ServiceProvider.services.through)
+def provider_services_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # Changed from the ServiceCategory side, pk_set holds provider ids
+        if pk_set is None:
+            transaction.on_commit(nearby_cache.invalidate_all)
+        else:
+            _invalidate_on_commit(*ServiceProvider.objects.filter(pk__in=pk_set).values_list('latitude', 'longitude'))
+    else:
+        _invalidate_on_commit((instance.latitude, instance.longitude))
+    transaction.on_commit(snapshot.schedule_rebuild)
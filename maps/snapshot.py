@@ -0,0 +1,322 @@
+# Memory-mapped snapshot of available providers shared by all worker processes.
+#
+# File layout (little endian), rows sorted by latitude so lookups can binary search a band:
+#     header   magic, version, row count, metadata length
+#     metadata JSON with service category names (bit order) and company names
+#     ids      int64[count]
+#     lat      float64[count]
+#     lon      float64[count]
+#     rating   float64[count]
+#     services uint64[count]  bitmask over the metadata service list
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+from .geohash import bounding_box
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RRPS'
+VERSION = 2
+HEADER = struct.Struct('<4sIII')
+MAX_SERVICES = 64
+KNN_START_KM = 1  # First search radius of an unbounded k-nearest lookup, grown 4x per step
+HALF_EARTH_KM = 20016  # Boxes at least this wide hold every provider
+
+ARRAYS = (
+    ('ids', np.int64),
+    ('lat', np.float64),
+    ('lon', np.float64),
+    ('rating', np.float64),
+    ('services', np.uint64),
+)
+
+
+def get_snapshot_path():
+    return getattr(settings, 'PROVIDER_SNAPSHOT_PATH', None)
+
+
+def get_rebuild_delay():
+    return getattr(settings, 'PROVIDER_SNAPSHOT_REBUILD_DELAY', 2)
+
+
+def _data_offset(meta_len):
+    # Align the arrays on 8 bytes so they can be viewed in place
+    offset = HEADER.size + meta_len
+    return offset + (-offset % 8)
+
+
+def _map_arrays(buffer, count, meta_len):
+    arrays = {}
+    offset = _data_offset(meta_len)
+    for name, dtype in ARRAYS:
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += count * np.dtype(dtype).itemsize
+    return arrays
+
+
+class ProviderSnapshot:
+    """Read-only, zero-copy view over a snapshot file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.key = (stat.st_dev, stat.st_ino)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, meta_len = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a provider snapshot')
+
+        meta = json.loads(self._mmap[HEADER.size:HEADER.size + meta_len])
+        self.service_names = meta['services']
+        self.company_names = meta['names']
+        self.count = count
+        arrays = _map_arrays(self._mmap, count, meta_len)
+        self.ids = arrays['ids']
+        self.lat = arrays['lat']
+        self.lon = arrays['lon']
+        self.rating = arrays['rating']
+        self.services = arrays['services']
+
+    def service_mask(self, service_types):
+        """Bitmask for a list of service names, unknown names are ignored"""
+        mask = 0
+        for name in service_types:
+            if name in self.service_names:
+                mask |= 1 << self.service_names.index(name)
+        return np.uint64(mask)
+
+    def services_for(self, mask):
+        mask = int(mask)
+        return [name for bit, name in enumerate(self.service_names) if mask & (1 << bit)]
+
+    def candidates(self, service_types=None, bounds=None):
+        """Indices of rows inside bounds (a geohash.bounding_box tuple), optionally offering any of service_types"""
+        start, end = 0, self.count
+        if bounds is not None:
+            min_lat, max_lat, min_lon, max_lon = bounds
+            start = int(np.searchsorted(self.lat, min_lat, side='left'))
+            end = int(np.searchsorted(self.lat, max_lat, side='right'))
+        keep = np.ones(end - start, dtype=bool)
+        if bounds is not None and min_lon is not None:
+            lons = self.lon[start:end]
+            keep &= (lons >= min_lon) & (lons <= max_lon)
+        if service_types:
+            keep &= (self.services[start:end] & self.service_mask(service_types)) != 0
+        return start + np.flatnonzero(keep)
+
+    def row(self, index):
+        return {
+            'id': int(self.ids[index]),
+            'company_name': self.company_names[index],
+            'latitude': float(self.lat[index]),
+            'longitude': float(self.lon[index]),
+            'services': self.services_for(self.services[index]),
+            'rating': float(self.rating[index]),
+        }
+
+
+_snapshot = None
+
+
+def get_snapshot():
+    """Return the current snapshot for this process, remapping only when the file was rebuilt"""
+    path = get_snapshot_path()
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None or snapshot.key != (stat.st_dev, stat.st_ino):
+        try:
+            snapshot = ProviderSnapshot(path)
+        except (OSError, ValueError):
+            return None
+        _snapshot = snapshot
+    return snapshot
+
+
+class _WriteLock:
+    """Serialize snapshot writers across processes with an advisory lock file"""
+
+    def __init__(self, path):
+        self.lock_path = f'{path}.lock'
+        self.file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        self.file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+
+def _service_categories():
+    from services.models import ServiceCategory
+    return list(ServiceCategory.objects.order_by('id').values_list('id', 'name'))
+
+
+def _provider_masks(provider_ids, category_bits):
+    from users.models import ServiceProvider
+    masks = dict.fromkeys(provider_ids, 0)
+    links = ServiceProvider.services.through.objects.filter(
+        serviceprovider_id__in=provider_ids
+    ).values_list('serviceprovider_id', 'servicecategory_id')
+    for provider_id, category_id in links:
+        masks[provider_id] |= 1 << category_bits[category_id]
+    return masks
+
+
+def build_snapshot():
+    """Rebuild the snapshot file from the database and atomically swap it in"""
+    from users.models import ServiceProvider
+
+    path = get_snapshot_path()
+    if not path:
+        return None
+
+    with _WriteLock(path):
+        categories = _service_categories()
+        if len(categories) > MAX_SERVICES:
+            # Too many categories for the bitmask, lookups fall back to the database
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        category_bits = {category_id: bit for bit, (category_id, _) in enumerate(categories)}
+
+        rows = list(
+            ServiceProvider.objects.filter(is_available=True, is_verified=True)
+            .order_by('latitude', 'id')
+            .values_list('id', 'company_name', 'latitude', 'longitude', 'rating')
+        )
+        masks = _provider_masks([row[0] for row in rows], category_bits) if rows else {}
+
+        meta = json.dumps({
+            'services': [name for _, name in categories],
+            'names': [row[1] for row in rows],
+        }).encode('utf-8')
+
+        count = len(rows)
+        buffer = bytearray(_data_offset(len(meta)) + count * sum(np.dtype(d).itemsize for _, d in ARRAYS))
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, count, len(meta))
+        buffer[HEADER.size:HEADER.size + len(meta)] = meta
+
+        arrays = _map_arrays(buffer, count, len(meta))
+        arrays['ids'][:] = [row[0] for row in rows]
+        arrays['lat'][:] = [row[2] for row in rows]
+        arrays['lon'][:] = [row[3] for row in rows]
+        arrays['rating'][:] = [row[4] for row in rows]
+        arrays['services'][:] = [masks[row[0]] for row in rows]
+
+        _write_swap(path, buffer)
+    return count
+
+
+def _write_swap(path, buffer):
+    # Readers keep the old inode mapped, so a rename never shows them a half-written row
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_rebuild_timer = None
+_rebuild_lock = threading.Lock()
+
+
+def schedule_rebuild():
+    """Rebuild the snapshot PROVIDER_SNAPSHOT_REBUILD_DELAY seconds from now
+
+    Provider changes arriving before then are folded into the same rebuild, so a burst of
+    saves rewrites the file once. A delay of 0 rebuilds straight away.
+    """
+    global _rebuild_timer
+    if not get_snapshot_path():
+        return
+    delay = get_rebuild_delay()
+    if not delay:
+        build_snapshot()
+        return
+    with _rebuild_lock:
+        if _rebuild_timer is None:
+            _rebuild_timer = threading.Timer(delay, _run_scheduled_rebuild)
+            _rebuild_timer.daemon = True
+            _rebuild_timer.start()
+
+
+def _run_scheduled_rebuild():
+    global _rebuild_timer
+    # Cleared first, so changes committed while building schedule another rebuild
+    with _rebuild_lock:
+        _rebuild_timer = None
+    close_old_connections()
+    try:
+        build_snapshot()
+    except Exception:
+        logger.exception('Failed to rebuild the provider snapshot')
+    finally:
+        close_old_connections()
+
+
+def _rank_rows(snapshot, candidates, user_lat, user_lon, max_distance_km, k):
+    from .utils import calculate_distances, calculate_etas, rank_nearest
+
+    if not len(candidates):
+        return []
+    lats = snapshot.lat[candidates]
+    lons = snapshot.lon[candidates]
+    distances = calculate_distances(user_lat, user_lon, lats, lons)
+    order = rank_nearest(user_lat, user_lon, lats, lons, distances, max_distance_km, k)
+    etas = calculate_etas(distances[order], lats[order], lons[order])
+
+    results = []
+    for i, eta in zip(order, etas):
+        row = snapshot.row(candidates[i])
+        row['distance'] = round(float(distances[i]), 2)
+        row['eta'] = int(eta)
+        results.append(row)
+    return results
+
+
+def query_snapshot(snapshot, user_lat, user_lon, service_types=None, max_distance_km=10, k=None):
+    """Nearby providers as API rows, computed entirely from the mapped arrays
+
+    Only rows in the bounding box of the search circle are ranked. Without a radius, the
+    box grows until it holds k providers within it.
+    """
+    if max_distance_km is not None:
+        bounds = bounding_box(user_lat, user_lon, max_distance_km)
+        return _rank_rows(snapshot, snapshot.candidates(service_types, bounds), user_lat, user_lon, max_distance_km, k)
+
+    radius = KNN_START_KM
+    while radius < HALF_EARTH_KM:
+        candidates = snapshot.candidates(service_types, bounding_box(user_lat, user_lon, radius))
+        rows = _rank_rows(snapshot, candidates, user_lat, user_lon, radius, k)
+        if k is not None and len(rows) >= k:
+            return rows
+        radius *= 4
+    return _rank_rows(snapshot, snapshot.candidates(service_types), user_lat, user_lon, None, k)
@@ -1,3 +1,752 @@
-from django.test import TestCase
+import io
+import math
+import os
+import random
+import datetime
+import tempfile
+from unittest import mock
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from bookings.models import AssistanceRequest, CurrentLocation, ProviderLocation, TripTracking
+from maps import archive, eta, geocoder, geohash, nearby_cache, polyline, routing, snapshot, tracking, views as map_views
+from maps.ingest import LocationBuffer, replay_spill
+from maps.pubsub import InProcessPubSub, get_broker
+from maps.tracking import (
+    extend_trip_trails, get_latest_location, publish_tracking_update, record_current_locations, tracking_channel,
+)
+from maps.utils import (
+    calculate_distance, calculate_distances, calculate_eta, calculate_etas, filter_by_proximity,
+    get_k_nearest_providers, rank_providers,
+)
+from services.models import ServiceCategory
+from users.models import Driver, User, ServiceProvider
 
-# Create your tests here.
+
+class NearbyProvidersApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver_user = User.objects.create_user(username='driver', password='pass')
+        self.client.force_login(self.driver_user)
+        self.categories = list(ServiceCategory.objects.all()[:2])
+        self.url = reverse('maps:nearby_providers_api')
+
+    def create_providers(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_providers(count)
+
+    def _create_providers(self, count):
+        for i in range(count):
+            user = User.objects.create(username=f'provider{ServiceProvider.objects.count()}', user_type='provider')
+            provider = ServiceProvider.objects.create(
+                user=user,
+                company_name=f'Provider {i}',
+                latitude=5.6037 + i * 0.001,
+                longitude=-0.1870,
+                address='Accra',
+                phone='0200000000',
+                is_verified=True,
+            )
+            provider.services.set(self.categories)
+
+    def count_queries(self, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params)
+        self.assertTrue(response.json()['success'])
+        return len(context.captured_queries), response.json()['providers']
+
+    def test_query_count_does_not_grow_with_providers(self):
+        self.create_providers(2)
+        few_queries, providers = self.count_queries({'lat': 5.6037, 'lon': -0.1870})
+        self.assertEqual(len(providers), 2)
+
+        self.create_providers(20)
+        many_queries, providers = self.count_queries({'lat': 5.6037, 'lon': -0.1870})
+        self.assertEqual(len(providers), 22)
+        self.assertEqual(few_queries, many_queries)
+
+    def test_rows_include_services_and_precomputed_distance(self):
+        self.create_providers(3)
+        _, providers = self.count_queries({'lat': 5.6037, 'lon': -0.1870, 'service_type': self.categories[0].name})
+
+        self.assertEqual([p['company_name'] for p in providers], ['Provider 0', 'Provider 1', 'Provider 2'])
+        self.assertEqual(providers[0]['services'], [c.name for c in self.categories])
+        self.assertEqual(providers[0]['distance'], 0.0)
+        self.assertEqual(providers[0]['eta'], 5)
+
+    def test_cached_candidates_are_reused_and_invalidated(self):
+        self.create_providers(2)
+        params = {'lat': 5.6037, 'lon': -0.1870}
+        miss_queries, _ = self.count_queries(params)
+        hit_queries, providers = self.count_queries({'lat': 5.6038, 'lon': -0.1871})
+        self.assertLess(hit_queries, miss_queries)
+        self.assertEqual(len(providers), 2)
+        self.assertEqual(nearby_cache.get_stats()['hits'], 1)
+
+        provider = ServiceProvider.objects.get(company_name='Provider 1')
+        provider.is_available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.save()
+        _, providers = self.count_queries(params)
+        self.assertEqual([p['company_name'] for p in providers], ['Provider 0'])
+
+    def test_invalidation_is_regional(self):
+        self.create_providers(1)
+        accra, kumasi = {'lat': 5.6037, 'lon': -0.1870}, {'lat': 6.6885, 'lon': -1.6244}
+        self.count_queries(accra)
+        self.count_queries(kumasi)
+
+        # Moving a provider within Accra leaves Kumasi's cached set alone
+        provider = ServiceProvider.objects.get()
+        provider.latitude = 5.6100
+        with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks(execute=True):
+            provider.save()
+        reads = [q for q in context.captured_queries if q['sql'].startswith('SELECT "users_serviceprovider"')]
+        self.assertEqual(reads, [])
+        nearby_cache.reset_stats()
+        self.count_queries(kumasi)
+        self.count_queries(accra)
+        self.assertEqual(nearby_cache.get_stats()['hits'], 1)
+
+        # Moving it to Kumasi expires both the old and the new spot
+        provider.latitude, provider.longitude = 6.6885, -1.6244
+        with self.captureOnCommitCallbacks(execute=True):
+            provider.save()
+        _, providers = self.count_queries(accra)
+        self.assertEqual(providers, [])
+        _, providers = self.count_queries(kumasi)
+        self.assertEqual(len(providers), 1)
+
+
+def create_provider(latitude, longitude, name=None, **fields):
+    index = ServiceProvider.objects.count()
+    user = User.objects.create(username=f'provider{index}', user_type='provider')
+    return ServiceProvider.objects.create(
+        user=user,
+        company_name=name or f'Provider {index}',
+        latitude=latitude,
+        longitude=longitude,
+        address='Accra',
+        phone='0200000000',
+        is_verified=True,
+        **fields,
+    )
+
+
+class GeohashTests(TestCase):
+    def test_encode_matches_reference(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash.encode(5.6037, -0.1870, 5), 'ebzzg')
+
+    def test_neighbors_surround_the_cell(self):
+        cells = geohash.neighbors('ebzzg')
+        self.assertEqual(len(cells), 9)
+        self.assertIn('ebzzg', cells)
+        min_lat, min_lon, max_lat, max_lon = geohash.decode_bounds('ebzzg')
+        # Points just across each edge and corner land in one of the neighbours
+        for lat in (min_lat - 1e-6, (min_lat + max_lat) / 2, max_lat + 1e-6):
+            for lon in (min_lon - 1e-6, (min_lon + max_lon) / 2, max_lon + 1e-6):
+                self.assertIn(geohash.encode(lat, lon, 5), cells)
+
+    def test_proximity_prefilter_keeps_everything_in_range(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            create_provider(5.6037 + rng.uniform(-0.2, 0.2), -0.1870 + rng.uniform(-0.2, 0.2))
+        for radius in (1, 5, 12):
+            expected = {
+                p.id for p in ServiceProvider.objects.all()
+                if calculate_distance(5.6037, -0.1870, p.latitude, p.longitude) <= radius
+            }
+            found = set(filter_by_proximity(ServiceProvider.objects.all(), 5.6037, -0.1870, radius).values_list('id', flat=True))
+            self.assertTrue(expected <= found)
+
+    def test_bulk_writes_keep_geohash_current(self):
+        provider = create_provider(5.6037, -0.1870)
+        ServiceProvider.objects.filter(pk=provider.pk).update(latitude=6.7, longitude=-1.6)
+        provider.refresh_from_db()
+        self.assertEqual(provider.geohash, geohash.encode(6.7, -1.6))
+
+        provider.latitude, provider.longitude = 5.6, -0.2
+        ServiceProvider.objects.bulk_update([provider], ['latitude', 'longitude'])
+        provider.refresh_from_db()
+        self.assertEqual(provider.geohash, geohash.encode(5.6, -0.2))
+        with self.assertRaises(ValueError):
+            ServiceProvider.objects.update(latitude=5.7)
+
+
+@override_settings(ETA_PROFILE_PATH=None)
+class VectorizedDistanceTests(TestCase):
+    def test_haversine_matches_scalar(self):
+        rng = np.random.default_rng(2)
+        lats, lons = rng.uniform(-89, 89, 500), rng.uniform(-180, 180, 500)
+        vectorized = calculate_distances(5.6037, -0.1870, lats, lons)
+        scalar = [calculate_distance(5.6037, -0.1870, lat, lon) for lat, lon in zip(lats, lons)]
+        np.testing.assert_allclose(vectorized, scalar, rtol=1e-9, atol=1e-9)
+
+    def test_etas_match_scalar(self):
+        distances = [0, 0.5, 2.49, 2.5, 7.3, 30, 120.75]
+        self.assertEqual(list(calculate_etas(distances)), [calculate_eta(d) for d in distances])
+
+
+class ProviderSnapshotTests(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROVIDER_SNAPSHOT_PATH=os.path.join(directory, 'snapshot.bin')))
+        self.category = ServiceCategory.objects.get_or_create(name='towing')[0]
+        self.providers = [create_provider(5.6037 + i * 0.01, -0.1870) for i in range(5)]
+        self.providers[3].services.set([self.category])
+        snapshot.build_snapshot()
+
+    def test_query_matches_database(self):
+        rows = snapshot.query_snapshot(snapshot.get_snapshot(), 5.6037, -0.1870, max_distance_km=3.5)
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.providers[:4]])
+        self.assertEqual(rows[2]['distance'], round(calculate_distance(5.6037, -0.1870, 5.6237, -0.1870), 2))
+        towing = snapshot.query_snapshot(snapshot.get_snapshot(), 5.6037, -0.1870, ['towing'])
+        self.assertEqual([row['id'] for row in towing], [self.providers[3].id])
+
+    def test_rebuilds_swap_the_file_under_readers(self):
+        reader = snapshot.get_snapshot()
+        moved = self.providers[0]
+        moved.latitude = 6.0
+        moved.save()
+        snapshot.build_snapshot()
+
+        # The reader's mapping still holds the complete old rows; new readers see the new ones
+        self.assertEqual(float(reader.lat[list(reader.ids).index(moved.id)]), 5.6037)
+        current = snapshot.get_snapshot()
+        self.assertIsNot(current, reader)
+        self.assertEqual(float(current.lat[list(current.ids).index(moved.id)]), 6.0)
+        self.assertEqual(list(current.lat), sorted(current.lat))
+
+        moved.is_available = False
+        moved.save()
+        snapshot.build_snapshot()
+        self.assertNotIn(moved.id, [row['id'] for row in snapshot.query_snapshot(snapshot.get_snapshot(), 6.0, -0.1870)])
+
+    def test_only_rows_in_the_bounding_box_are_ranked(self):
+        far = [create_provider(5.6037 + i, -0.1870 + i) for i in range(1, 4)]
+        snapshot.build_snapshot()
+        current = snapshot.get_snapshot()
+        with mock.patch('maps.utils.calculate_distances', wraps=calculate_distances) as distances:
+            rows = snapshot.query_snapshot(current, 5.6037, -0.1870, max_distance_km=1.5)
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.providers[:2]])
+        self.assertEqual(len(distances.call_args.args[2]), 2)
+
+        # Without a radius the box grows until k providers are inside it
+        nearest = snapshot.query_snapshot(current, 8.6, 2.8, max_distance_km=None, k=2)
+        self.assertEqual([row['id'] for row in nearest], [far[2].id, far[1].id])
+
+    def test_saves_are_batched_into_one_rebuild(self):
+        with self.settings(PROVIDER_SNAPSHOT_REBUILD_DELAY=0.05), \
+                mock.patch.object(snapshot, 'build_snapshot') as build, \
+                mock.patch.object(snapshot, 'close_old_connections'):
+            for provider in self.providers:
+                with self.captureOnCommitCallbacks(execute=True):
+                    provider.rating = 4.0
+                    provider.save()
+            timer = snapshot._rebuild_timer
+            timer.join()
+        build.assert_called_once_with()
+        self.assertIsNone(snapshot._rebuild_timer)
+
+
+@override_settings(ETA_PROFILE_PATH=None)
+class KNearestTests(TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        # Dense around Accra, sparse further out, so searches need several rings
+        for scale in [0.01] * 5 + [0.3] * 10 + [3] * 10:
+            create_provider(5.6037 + rng.uniform(-scale, scale), -0.1870 + rng.uniform(-scale, scale))
+
+    def brute_force(self, k, max_distance_km=None):
+        distances = sorted(
+            (calculate_distance(5.6037, -0.1870, p.latitude, p.longitude), p.id) for p in ServiceProvider.objects.all()
+        )
+        if max_distance_km is not None:
+            distances = [row for row in distances if row[0] <= max_distance_km]
+        return [provider_id for _, provider_id in distances[:k]]
+
+    def test_rings_match_brute_force(self):
+        for k in (1, 3, 8, 20):
+            found = [p.id for p in get_k_nearest_providers(5.6037, -0.1870, k)]
+            self.assertEqual(found, self.brute_force(k), k)
+        found = [p.id for p in get_k_nearest_providers(5.6037, -0.1870, 20, max_distance_km=30)]
+        self.assertEqual(found, self.brute_force(20, 30))
+
+    def test_unbounded_search_stops_at_the_coarsest_ring(self):
+        antipode = create_provider(-5.6037, 179.8130)
+        found = [p.id for p in get_k_nearest_providers(5.6037, -0.1870, 100)]
+        self.assertEqual(len(found), 25)
+        self.assertNotIn(antipode.id, found)
+
+
+def create_trip(status='accepted', latitude=5.6037, longitude=-0.1870):
+    provider = create_provider(latitude, longitude)
+    user = User.objects.create_user(username=f'driver{User.objects.count()}', password='pass')
+    driver = Driver.objects.create(user=user, vehicle_type='Sedan', license_plate='GR-1234-20')
+    return AssistanceRequest.objects.create(
+        driver=driver, accepted_provider=provider, service_type='towing',
+        latitude=latitude, longitude=longitude, status=status,
+    )
+
+
+class PubSubTests(TestCase):
+    def test_publish_reaches_only_current_subscribers(self):
+        broker = InProcessPubSub()
+        subscription = broker.subscribe('trip')
+        self.assertTrue(broker.has_subscribers('trip'))
+        self.assertFalse(broker.has_subscribers('other'))
+        self.assertEqual(broker.publish('trip', {'n': 1}), 1)
+        self.assertEqual(subscription.get(timeout=0), {'n': 1})
+        self.assertIsNone(subscription.get(timeout=0.01))
+
+        subscription.close()
+        self.assertFalse(broker.has_subscribers('trip'))
+        self.assertEqual(broker.publish('trip', {'n': 2}), 0)
+
+    def test_unwatched_updates_build_no_payload(self):
+        assistance_request = create_trip()
+        with mock.patch('maps.tracking.build_tracking_payload') as build:
+            publish_tracking_update(assistance_request)
+        build.assert_not_called()
+
+
+class TrackingStreamTests(TestCase):
+    def setUp(self):
+        self.assistance_request = create_trip()
+        self.client.force_login(self.assistance_request.driver.user)
+        self.url = reverse('maps:tracking_stream', args=[self.assistance_request.tracking_id])
+
+    def test_stream_ends_with_terminal_event(self):
+        response = self.client.get(self.url)
+        frames = iter(response.streaming_content)
+        self.assertTrue(next(frames).decode().startswith('data: '))
+
+        # A finished trip is pushed, then the end event tells the browser not to reconnect
+        channel = tracking_channel(self.assistance_request.tracking_id)
+        get_broker().publish(channel, {'status': 'completed'})
+        self.assertEqual(next(frames).decode(), 'data: {"status": "completed"}\n\n')
+        self.assertEqual(next(frames).decode(), 'event: end\ndata: {}\n\n')
+        # Reading to the end closes the response
+        self.assertEqual(list(frames), [])
+        self.assertFalse(get_broker().has_subscribers(channel))
+        self.assertEqual(map_views._open_streams, 0)
+
+    def test_finished_trip_gets_no_stream(self):
+        AssistanceRequest.objects.filter(pk=self.assistance_request.pk).update(status='cancelled')
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    @override_settings(TRACKING_MAX_STREAMS=1)
+    def test_streams_per_process_are_capped(self):
+        first = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url).status_code, 503)
+        frames = iter(first.streaming_content)
+        next(frames)  # The stream subscribes when first read
+        get_broker().publish(tracking_channel(self.assistance_request.tracking_id), {'status': 'completed'})
+        list(frames)
+        self.assertEqual(map_views._open_streams, 0)
+
+
+class LocationBufferTests(TestCase):
+    def setUp(self):
+        self.assistance_request = create_trip()
+        # A long interval keeps the background flush thread out of the way
+        self.buffer = LocationBuffer(flush_size=10, flush_interval=3600, max_attempts=2)
+        self.addCleanup(self.buffer.stopped.set)
+
+    def locations(self, count):
+        start = datetime.datetime(2026, 1, 5, 8, 0, tzinfo=datetime.timezone.utc)
+        return [
+            ProviderLocation(
+                provider_id=self.assistance_request.accepted_provider_id,
+                assistance_request_id=self.assistance_request.id,
+                latitude=[5.6, 5.61, 5.62, 5.63][i], longitude=-0.187,
+                timestamp=start + datetime.timedelta(seconds=i),
+            )
+            for i in range(count)
+        ]
+
+    def test_flush_writes_batch_and_current_position(self):
+        self.buffer.add(self.locations(3))
+        self.assertEqual(ProviderLocation.objects.count(), 0)
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(ProviderLocation.objects.count(), 3)
+        self.assertEqual(CurrentLocation.objects.get().latitude, 5.62)
+
+    def test_failed_flush_is_retried_then_spilled(self):
+        self.buffer.add(self.locations(3))
+        failing = mock.patch.object(ProviderLocation.objects, 'bulk_create', side_effect=RuntimeError('database down'))
+        with failing, self.assertLogs('maps.ingest', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+            # Requeued, not dropped
+            self.assertEqual(len(self.buffer.pending), 3)
+            self.assertEqual(self.buffer.flush(), 0)
+        # Out of attempts: the points went to the spill file
+        self.assertEqual(self.buffer.pending, [])
+        self.assertEqual(ProviderLocation.objects.count(), 0)
+
+        self.assertEqual(replay_spill(self.buffer), 3)
+        self.assertEqual(
+            list(ProviderLocation.objects.order_by('timestamp').values_list('latitude', flat=True)), [5.6, 5.61, 5.62]
+        )
+        self.assertEqual(replay_spill(self.buffer), 0)
+
+    def test_retry_after_transient_failure(self):
+        self.buffer.add(self.locations(2))
+        failing = mock.patch.object(ProviderLocation.objects, 'bulk_create', side_effect=RuntimeError('locked'))
+        with failing, self.assertLogs('maps.ingest', 'ERROR'):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(ProviderLocation.objects.count(), 2)
+
+    def test_client_timestamps_are_validated(self):
+        url = reverse('maps:update_provider_location')
+        payload = {'tracking_id': str(self.assistance_request.tracking_id), 'points': [
+            {'latitude': 5.6, 'longitude': -0.187, 'timestamp': 'yesterday'},
+        ]}
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        payload['points'][0]['timestamp'] = '2026-01-05T08:00:00'
+        with mock.patch('maps.views.get_location_buffer') as get_buffer:
+            response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        queued = get_buffer.return_value.add.call_args[0][0]
+        self.assertEqual(queued[0].timestamp, datetime.datetime(2026, 1, 5, 8, 0, tzinfo=datetime.timezone.utc))
+
+
+class CurrentLocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.assistance_request = create_trip()
+
+    def location(self, latitude, minute):
+        return ProviderLocation(
+            provider_id=self.assistance_request.accepted_provider_id,
+            assistance_request_id=self.assistance_request.id,
+            latitude=latitude, longitude=-0.187,
+            timestamp=datetime.datetime(2026, 1, 5, 8, minute, tzinfo=datetime.timezone.utc),
+        )
+
+    def test_out_of_order_batch_does_not_move_position_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_current_locations([self.location(5.61, 1), self.location(5.62, 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            # A retried batch arriving after the newer one
+            record_current_locations([self.location(5.6, 0), self.location(5.61, 1)])
+
+        current = CurrentLocation.objects.get()
+        self.assertEqual((current.latitude, current.timestamp.minute), (5.62, 2))
+        self.assertEqual(get_latest_location(self.assistance_request).latitude, 5.62)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_current_locations([self.location(5.63, 3)])
+        self.assertEqual(CurrentLocation.objects.get().latitude, 5.63)
+        self.assertEqual(get_latest_location(self.assistance_request).latitude, 5.63)
+
+
+class PolylineTests(TestCase):
+    def test_reference_encoding_round_trips(self):
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        encoded = polyline.encode(points)
+        self.assertEqual(encoded, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(polyline.decode(encoded), points)
+
+    def test_continuation_appends_to_existing_polyline(self):
+        points = [(5.6037, -0.187), (5.6101, -0.1812), (5.6155, -0.1799), (5.62, -0.17)]
+        head = polyline.encode(points[:2])
+        rest = polyline.encode(points[2:], start=points[1])
+        self.assertEqual(head + rest, polyline.encode(points))
+        self.assertEqual(polyline.decode(rest, start=points[1]), points[2:])
+
+    def test_simplify_drops_points_on_a_straight_line(self):
+        line = [(5.6 + i * 0.001, -0.187) for i in range(10)]
+        self.assertEqual(polyline.simplify(line), [line[0], line[-1]])
+        corner = line[:5] + [(5.604, -0.187 + i * 0.001) for i in range(1, 5)]
+        self.assertEqual(polyline.simplify(corner), [corner[0], corner[4], corner[-1]])
+
+
+class TripTrailTests(TestCase):
+    def setUp(self):
+        self.assistance_request = create_trip()
+        self.start = datetime.datetime(2026, 1, 5, 8, 0, tzinfo=datetime.timezone.utc)
+
+    def locations(self, points, offset=0):
+        return [
+            ProviderLocation(
+                provider_id=self.assistance_request.accepted_provider_id,
+                assistance_request_id=self.assistance_request.id,
+                latitude=latitude, longitude=longitude,
+                timestamp=self.start + datetime.timedelta(seconds=offset + i),
+            )
+            for i, (latitude, longitude) in enumerate(points)
+        ]
+
+    def test_batches_extend_the_settled_prefix(self):
+        # A zigzag so every point survives simplification
+        points = [(round(5.6 + i * 0.01, 2), round(-0.187 + (i % 2) * 0.01, 3)) for i in range(12)]
+        prefixes = []
+        for offset in range(0, 12, 3):
+            extend_trip_trails(self.locations(points[offset:offset + 3], offset))
+            trip = TripTracking.objects.get()
+            prefixes.append(trip.route_polyline[:trip.route_fixed_length])
+            self.assertEqual(polyline.decode(trip.route_polyline), points[:offset + 3])
+
+        for previous, current in zip(prefixes, prefixes[1:]):
+            self.assertTrue(current.startswith(previous))
+        self.assertEqual(polyline.decode(trip.route_anchor), [points[-3]])
+
+    def test_straight_segments_collapse_across_batches(self):
+        extend_trip_trails(self.locations([(5.6, -0.187), (5.601, -0.187)]))
+        extend_trip_trails(self.locations([(5.602, -0.187), (5.603, -0.187)], 2))
+        route = polyline.decode(TripTracking.objects.get().route_polyline)
+        self.assertEqual(route, [(5.6, -0.187), (5.603, -0.187)])
+
+    def test_late_batches_do_not_land_after_the_tail(self):
+        points = [(round(5.6 + i * 0.01, 2), round(-0.187 + (i % 2) * 0.01, 3)) for i in range(9)]
+        extend_trip_trails(self.locations(points[:3]))
+        extend_trip_trails(self.locations(points[6:], 6))
+        # Points 3-5 arrive late, points 6-8 again as a retry, and 9 is new
+        extend_trip_trails(self.locations(points[3:] + [(5.7, -0.187)], 3))
+
+        trip = TripTracking.objects.get()
+        self.assertEqual(polyline.decode(trip.route_polyline), points[:3] + points[6:] + [(5.7, -0.187)])
+        self.assertEqual(trip.route_last_at, self.start + datetime.timedelta(seconds=9))
+
+
+@override_settings(ETA_PROFILE_PATH=None, ROAD_GRAPH_PATH=None)
+class TrackingUpdatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.assistance_request = create_trip()
+        self.client.force_login(self.assistance_request.driver.user)
+        self.url = reverse('maps:tracking_updates', args=[self.assistance_request.tracking_id])
+        start = datetime.datetime(2026, 1, 5, 8, 0, tzinfo=datetime.timezone.utc)
+        locations = ProviderLocation.objects.bulk_create([
+            ProviderLocation(
+                provider_id=self.assistance_request.accepted_provider_id,
+                assistance_request_id=self.assistance_request.id,
+                latitude=5.6 + i / 100, longitude=-0.187,
+                timestamp=start + datetime.timedelta(seconds=i),
+            )
+            for i in range(7)
+        ])
+        record_current_locations(locations)
+
+    @mock.patch.object(tracking, 'MAX_DELTA_POINTS', 3)
+    def test_delta_pages_through_every_point_in_order(self):
+        first_id = ProviderLocation.objects.order_by('id').first().id
+        cursor, seen, pages = first_id - 1, [], []
+        while True:
+            data = self.client.get(self.url, {'since': cursor}).json()
+            seen += [point['lat'] for point in data['location_history']]
+            pages.append(len(data['location_history']))
+            cursor = data['cursor']
+            if not data['more']:
+                break
+        self.assertEqual(seen, [5.6 + i / 100 for i in range(7)])
+        self.assertEqual(pages, [3, 3, 1])
+        self.assertEqual(cursor, ProviderLocation.objects.order_by('id').last().id)
+
+    def test_if_none_match_is_parsed_as_a_list(self):
+        etag = self.client.get(self.url)['ETag']
+        for header in (etag, f'"other", {etag}', f'W/{etag}', '*'):
+            self.assertEqual(self.client.get(self.url, headers={'If-None-Match': header}).status_code, 304)
+        # A tag that merely contains the current one is a different tag
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': f'"x{etag[1:]}'}).status_code, 200)
+
+        CurrentLocation.objects.update(latitude=5.7)
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 200)
+
+
+class LocationArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.assistance_request = create_trip(status='completed')
+        self.start = timezone.now() - datetime.timedelta(days=3)
+        AssistanceRequest.objects.filter(id=self.assistance_request.id).update(created_at=self.start)
+        ProviderLocation.objects.bulk_create([
+            ProviderLocation(
+                provider_id=self.assistance_request.accepted_provider_id,
+                assistance_request_id=self.assistance_request.id,
+                latitude=5.6 + i / 1000, longitude=-0.187, speed=30.0,
+                timestamp=self.start + datetime.timedelta(minutes=i),
+            )
+            for i in range(120)
+        ])
+        self.expected = sorted(ProviderLocation.objects.values_list('latitude', 'longitude', 'timestamp'), key=lambda row: row[2])
+
+    def archived(self):
+        return archive.load_trails(archive_dir=self.archive_dir)
+
+    def test_round_trip(self):
+        self.assertEqual(archive.archive_locations(interval_seconds=0, archive_dir=self.archive_dir), (1, 120, 120))
+        self.assertFalse(ProviderLocation.objects.exists())
+        self.assertEqual(archive.load_trail(AssistanceRequest.objects.get(), archive_dir=self.archive_dir), self.expected)
+        self.assertEqual(archive.archive_locations(archive_dir=self.archive_dir), (0, 0, 0))
+
+    def test_interrupted_batch_is_rewritten_not_duplicated(self):
+        with mock.patch.object(archive.transaction, 'atomic', side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                archive.archive_locations(interval_seconds=0, archive_dir=self.archive_dir)
+        # Files written, rows still there
+        self.assertEqual(self.archived().num_rows, 120)
+        self.assertEqual(ProviderLocation.objects.count(), 120)
+
+        self.assertEqual(archive.archive_locations(interval_seconds=0, archive_dir=self.archive_dir), (1, 120, 120))
+        self.assertEqual(self.archived().num_rows, 120)
+        self.assertFalse(ProviderLocation.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.archive_dir, archive.JOURNAL_NAME)))
+
+
+class EtaProfileTests(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.archive_dir = os.path.join(directory, 'archive')
+        self.profile_path = os.path.join(directory, 'eta_profile.npz')
+        self.enterContext(override_settings(LOCATION_ARCHIVE_DIR=self.archive_dir, ETA_PROFILE_PATH=self.profile_path))
+
+    def test_lookup_by_cell_and_hour(self):
+        monday_9am = datetime.datetime(2026, 1, 5, 9, 0, tzinfo=datetime.timezone.utc)
+        keys = eta.profile_keys([5.6037], [-0.187], [eta.hour_of_week(monday_9am)])
+        eta.save_profile(keys, np.array([12.0], dtype=np.float32), np.array([40]))
+
+        speeds = eta.profile_speeds([5.6037, 5.61, 5.9], [-0.187, -0.18, -0.187], monday_9am)
+        # Same ~5km cell, then a cell with no data
+        self.assertEqual(list(speeds[:2]), [12.0, 12.0])
+        self.assertTrue(np.isnan(speeds[2]))
+        self.assertTrue(np.isnan(eta.profile_speeds([5.6037], [-0.187], monday_9am + datetime.timedelta(hours=1))[0]))
+        self.assertEqual(calculate_eta(6, 5.6037, -0.187, monday_9am), 35)
+
+    def test_build_from_table_and_archive_batches(self):
+        assistance_request = create_trip(status='completed')
+        start = timezone.now() - datetime.timedelta(days=3)
+        AssistanceRequest.objects.filter(id=assistance_request.id).update(created_at=start)
+        rng = np.random.default_rng(7)
+        locations = [
+            ProviderLocation(
+                provider_id=assistance_request.accepted_provider_id,
+                assistance_request_id=assistance_request.id,
+                latitude=5.6, longitude=-0.187, speed=float(speed),
+                timestamp=start + datetime.timedelta(minutes=i),
+            )
+            for i, speed in enumerate(rng.uniform(10, 60, 90))
+        ]
+        ProviderLocation.objects.bulk_create(locations[:60])
+        archive.archive_locations(interval_seconds=0)
+        ProviderLocation.objects.bulk_create(locations[60:])
+
+        call_command('build_eta_profile', batch_size=7, stdout=io.StringIO())
+
+        expected = eta.finalize_profile(*eta.aggregate_samples(
+            [location.latitude for location in locations],
+            [location.longitude for location in locations],
+            [int(location.timestamp.timestamp()) for location in locations],
+            [location.speed for location in locations],
+        ))
+        with np.load(self.profile_path) as built:
+            np.testing.assert_array_equal(built['keys'], expected[0])
+            np.testing.assert_allclose(built['speeds'], expected[1], rtol=1e-6)
+            np.testing.assert_array_equal(built['counts'], expected[2])
+
+
+def build_road_graph(nodes, roads):
+    """Graph arrays for (lat, lon) nodes joined by two-way roads given as node index pairs"""
+    lat = np.array([node[0] for node in nodes])
+    lon = np.array([node[1] for node in nodes])
+    sources = np.array([a for a, b in roads] + [b for a, b in roads])
+    targets = np.array([b for a, b in roads] + [a for a, b in roads])
+    km = routing._edge_lengths(lat[sources], lon[sources], lat[targets], lon[targets])
+    indptr, indices, weights = routing._to_csr(len(nodes), sources, targets, km)
+    rindptr, rindices, rweights = routing._to_csr(len(nodes), targets, sources, km)
+    return {
+        'lat': lat, 'lon': lon,
+        'indptr': indptr, 'indices': indices, 'km': weights,
+        'rindptr': rindptr, 'rindices': rindices, 'rkm': rweights,
+    }
+
+
+@override_settings(ETA_PROFILE_PATH=None)
+class RoutingTests(TestCase):
+    # A provider just across a river from the user, whose road goes round by a bridge 2.5km east
+    USER = (5.6, -0.187)
+    ACROSS_RIVER = (5.5955, -0.187)
+    UP_THE_ROAD = (5.6072, -0.187)
+    BRIDGE = (5.6, -0.1645)
+
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'road_graph.npz')
+        self.enterContext(override_settings(ROAD_GRAPH_PATH=self.path, DISTANCE_BACKEND='road'))
+
+    def test_a_star_matches_dijkstra(self):
+        rng = np.random.default_rng(3)
+        nodes = list(zip(rng.uniform(5.55, 5.65, 40), rng.uniform(-0.24, -0.14, 40)))
+        roads = [(i, i + 1) for i in range(39)] + [tuple(pair) for pair in rng.integers(0, 40, (40, 2)) if pair[0] != pair[1]]
+        graph = routing.RoadGraph(build_road_graph(nodes, roads))
+        for source, target in rng.integers(0, 40, (30, 2)):
+            expected = graph.distances_to(int(target), 1000).get(int(source))
+            self.assertAlmostEqual(graph.shortest_path_km(int(source), int(target)), expected, places=4)
+
+    def test_nearest_node_searches_the_whole_snap_radius(self):
+        graph = routing.RoadGraph(build_road_graph([self.USER, self.BRIDGE], [(0, 1)]))
+        # ~1.7km north: two grid cells away, inside MAX_SNAP_KM
+        self.assertEqual(graph.nearest_node(5.6153, -0.187), 0)
+        self.assertIsNone(graph.nearest_node(5.62, -0.187))
+
+    def test_road_rerank_looks_past_the_straight_line_k_nearest(self):
+        routing.save_graph(build_road_graph(
+            [self.USER, self.ACROSS_RIVER, self.UP_THE_ROAD, self.BRIDGE], [(0, 2), (0, 3), (3, 1)]
+        ), self.path)
+        across = create_provider(*self.ACROSS_RIVER, name='Across the river')
+        up_the_road = create_provider(*self.UP_THE_ROAD, name='Up the road')
+
+        providers = list(ServiceProvider.objects.all())
+        self.assertEqual(rank_providers(providers, *self.USER, k=1), [up_the_road])
+        ranked = rank_providers(providers, *self.USER)
+        self.assertEqual(ranked, [up_the_road, across])
+        self.assertAlmostEqual(ranked[1].distance, 5.05, delta=0.05)
+        self.assertEqual(rank_providers(providers, *self.USER, max_distance_km=3), [up_the_road])
+
+        nearest = get_k_nearest_providers(*self.USER, 1)
+        self.assertEqual([provider.id for provider in nearest], [up_the_road.id])
+
+
+class GeocoderTests(TestCase):
+    def test_kd_tree_nearest_matches_brute_force(self):
+        rng = np.random.default_rng(11)
+        lats, lons = rng.uniform(-60, 60, 2000), rng.uniform(-180, 180, 2000)
+        # Duplicates and a dense cluster stress the median splits
+        lats[:50], lons[:50] = 5.6, -0.187
+        lats[50:300], lons[50:300] = rng.normal(5.6, 0.05, 250), rng.normal(-0.187, 0.05, 250)
+        points = geocoder._to_xyz(lats, lons)
+
+        for leaf_size in (1, 16):
+            tree = geocoder.KDTree(points, leaf_size=leaf_size)
+            queries = geocoder._to_xyz(rng.uniform(-70, 70, 200), rng.uniform(-180, 180, 200))
+            for query in np.vstack([queries, points[::97]]):
+                index, distance = tree.nearest(query)
+                brute = np.sqrt(((points - query) ** 2).sum(axis=1))
+                self.assertAlmostEqual(distance, brute.min(), places=12)
+                self.assertAlmostEqual(brute[index], brute.min(), places=12)
+
+        self.assertEqual(geocoder.KDTree(np.empty((0, 3))).nearest(points[0]), (None, math.inf))
+
+    def test_reverse_geocode_from_csv_gazetteer(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'gazetteer.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('name,latitude,longitude,region,country\n')
+            f.write('Osu,5.5560,-0.1769,Greater Accra,GH\n')
+            f.write('Madina,5.6685,-0.1657,Greater Accra,GH\n')
+            f.write('Kumasi,6.6885,-1.6244,Ashanti,GH\n')
+
+        with override_settings(GEOCODER_GAZETTEER_PATH=path):
+            place = geocoder.reverse_geocode(5.65, -0.17)
+            self.assertEqual(place['display_name'], 'Madina, Greater Accra, GH')
+            self.assertAlmostEqual(place['distance_km'], calculate_distance(5.65, -0.17, 5.6685, -0.1657), delta=0.01)
+            self.assertEqual(geocoder.reverse_geocode(6.5, -1.5)['name'], 'Kumasi')
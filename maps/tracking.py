@@ -0,0 +1,254 @@
+import hashlib
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from bookings.models import AssistanceRequest, CurrentLocation, ProviderLocation, TripTracking
+from . import polyline, routing
+from .pubsub import get_broker
+from .utils import calculate_distance, calculate_eta
+
+
+CURRENT_LOCATION_TTL = 60 * 60
+ROUTE_TOLERANCE_M = 10  # Douglas-Peucker tolerance for stored trails
+MAX_DELTA_POINTS = 100
+
+
+def tracking_channel(tracking_id):
+    return f'tracking:{tracking_id}'
+
+
+def _current_location_key(request_id):
+    return f'tracking:current:{request_id}'
+
+
+def record_current_locations(locations):
+    """Upsert the current position of each request from a batch of ProviderLocation rows
+
+    Only moves a position forward in time, so a late or retried batch carrying
+    older points leaves newer positions in place.
+    """
+    latest = {}
+    for location in locations:
+        previous = latest.get(location.assistance_request_id)
+        if previous is None or location.timestamp >= previous.timestamp:
+            latest[location.assistance_request_id] = location
+
+    current = [
+        CurrentLocation(
+            assistance_request_id=location.assistance_request_id,
+            provider_id=location.provider_id,
+            latitude=location.latitude,
+            longitude=location.longitude,
+            timestamp=location.timestamp,
+            speed=location.speed,
+            heading=location.heading,
+        )
+        for location in latest.values()
+    ]
+    with transaction.atomic():
+        CurrentLocation.objects.bulk_create(current, ignore_conflicts=True)
+        stored = dict(
+            CurrentLocation.objects.filter(assistance_request_id__in=list(latest)).values_list('assistance_request_id', 'timestamp')
+        )
+        moved = []
+        for position in current:
+            timestamp = stored.get(position.assistance_request_id)
+            if timestamp == position.timestamp:
+                # Inserted just now (or already identical)
+                moved.append(position)
+            elif timestamp is not None and timestamp < position.timestamp:
+                # The timestamp condition also covers a newer write landing after the read above
+                if CurrentLocation.objects.filter(
+                    assistance_request_id=position.assistance_request_id, timestamp__lt=position.timestamp
+                ).update(
+                    provider_id=position.provider_id,
+                    latitude=position.latitude,
+                    longitude=position.longitude,
+                    timestamp=position.timestamp,
+                    speed=position.speed,
+                    heading=position.heading,
+                ):
+                    moved.append(position)
+    if moved:
+        transaction.on_commit(
+            lambda: cache.set_many({_current_location_key(c.assistance_request_id): c for c in moved}, CURRENT_LOCATION_TTL)
+        )
+
+
+def extend_trip_trails(locations):
+    """Append new points to each trip's simplified, polyline-encoded route
+
+    Points no newer than the route's last point are skipped, so a late or
+    out-of-order batch cannot be appended after the newer tail.
+    """
+    locations_by_request = {}
+    for location in sorted(locations, key=lambda location: location.timestamp):
+        locations_by_request.setdefault(location.assistance_request_id, []).append(location)
+
+    with transaction.atomic():
+        trips = {
+            trip.assistance_request_id: trip
+            for trip in TripTracking.objects.select_for_update().filter(assistance_request_id__in=list(locations_by_request))
+        }
+        new_trips = []
+        for request_id, latitude, longitude in AssistanceRequest.objects.filter(
+            id__in=[request_id for request_id in locations_by_request if request_id not in trips]
+        ).values_list('id', 'latitude', 'longitude'):
+            first = locations_by_request[request_id][0]
+            trip = TripTracking(
+                assistance_request_id=request_id,
+                provider_start_lat=first.latitude,
+                provider_start_lon=first.longitude,
+                destination_lat=latitude,
+                destination_lon=longitude,
+            )
+            trips[request_id] = trip
+            new_trips.append(trip)
+
+        changed = []
+        for request_id, request_locations in locations_by_request.items():
+            trip = trips[request_id]
+            if trip.route_last_at is not None:
+                request_locations = [location for location in request_locations if location.timestamp > trip.route_last_at]
+            if not request_locations:
+                continue
+            _extend_route(trip, [(location.latitude, location.longitude) for location in request_locations])
+            trip.route_last_at = request_locations[-1].timestamp
+            changed.append(trip)
+
+        TripTracking.objects.bulk_create(new_trips)
+        TripTracking.objects.bulk_update(
+            [trip for trip in changed if trip not in new_trips],
+            ['route_polyline', 'route_fixed_length', 'route_anchor', 'route_last_at'],
+        )
+
+
+def _extend_route(trip, points):
+    # Only the unsettled tail is decoded, so the cost does not grow with the route.
+    # The tail's last two points are re-simplified with the new ones so a previous
+    # batch's endpoint can still be dropped if it lies on a straight line
+    fixed = trip.route_polyline[:trip.route_fixed_length]
+    anchor = polyline.decode(trip.route_anchor)[0] if trip.route_anchor else None
+    tail = polyline.decode(trip.route_polyline[trip.route_fixed_length:], anchor)
+
+    route = polyline.simplify(tail + points, ROUTE_TOLERANCE_M)
+    settled, tail = route[:-2], route[-2:]
+    if settled:
+        fixed += polyline.encode(settled, anchor)
+        anchor = settled[-1]
+        trip.route_anchor = polyline.encode([anchor])
+    trip.route_fixed_length = len(fixed)
+    trip.route_polyline = fixed + polyline.encode(tail, anchor)
+
+
+def get_latest_location(assistance_request):
+    """Current provider position for a request: cache, then the current row, then history"""
+    key = _current_location_key(assistance_request.id)
+    location = cache.get(key)
+    if location is not None:
+        return location
+
+    location = CurrentLocation.objects.filter(assistance_request=assistance_request).first()
+    if location is None:
+        # Trips recorded before current positions were tracked
+        latest = ProviderLocation.objects.filter(
+            assistance_request=assistance_request
+        ).order_by('-timestamp').first()
+        if latest is None:
+            return None
+        record_current_locations([latest])
+        return cache.get(key) or latest
+
+    cache.set(key, location, CURRENT_LOCATION_TTL)
+    return location
+
+
+def tracking_etag(assistance_request, latest_location, since=None):
+    """ETag that changes whenever the provider position or the request status changes"""
+    if latest_location is None:
+        position = 'none'
+    else:
+        position = f'{latest_location.timestamp.isoformat()}:{latest_location.latitude}:{latest_location.longitude}'
+    digest = hashlib.md5(f'{assistance_request.status}:{position}:{since}'.encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def build_tracking_payload(assistance_request, since=None, latest_location=None):
+    """Latest provider position, ETA and route for a request
+
+    Without a cursor the route is sent as route_polyline; with one, location_history
+    holds the next points recorded after it, in id order.
+    """
+    # Get latest provider location
+    if latest_location is None:
+        latest_location = get_latest_location(assistance_request)
+
+    user_location = {
+        'lat': assistance_request.latitude,
+        'lon': assistance_request.longitude
+    }
+
+    if not latest_location:
+        return {
+            'success': True,
+            'provider_location': None,
+            'user_location': user_location,
+            'status': assistance_request.status
+        }
+
+    # Calculate ETA and distance, by road when a road graph is loaded
+    distance = routing.road_distance(
+        latest_location.latitude, latest_location.longitude,
+        assistance_request.latitude, assistance_request.longitude
+    )
+    if distance is None:
+        distance = calculate_distance(
+            latest_location.latitude, latest_location.longitude,
+            assistance_request.latitude, assistance_request.longitude
+        )
+    eta = calculate_eta(distance, latest_location.latitude, latest_location.longitude)
+
+    payload = {
+        'success': True,
+        'provider_location': {
+            'lat': latest_location.latitude,
+            'lon': latest_location.longitude,
+            'timestamp': latest_location.timestamp.isoformat()
+        },
+        'user_location': user_location,
+        'distance': round(distance, 2),
+        'eta': eta,
+        'delta': since is not None,
+        'status': assistance_request.status
+    }
+
+    if since is None:
+        # Whole route as one encoded polyline, see extend_trip_trails
+        payload['route_polyline'] = TripTracking.objects.filter(
+            assistance_request=assistance_request
+        ).values_list('route_polyline', flat=True).first() or ''
+        payload['cursor'] = ProviderLocation.objects.filter(
+            assistance_request=assistance_request
+        ).aggregate(cursor=Max('id'))['cursor'] or 0
+        return payload
+
+    # The raw points recorded after the client's cursor, oldest first. At most
+    # MAX_DELTA_POINTS per response; "more" tells the client to ask again
+    recent_locations = list(ProviderLocation.objects.filter(
+        assistance_request=assistance_request, id__gt=since
+    ).order_by('id').values_list('id', 'latitude', 'longitude')[:MAX_DELTA_POINTS + 1])
+
+    payload['more'] = len(recent_locations) > MAX_DELTA_POINTS
+    recent_locations = recent_locations[:MAX_DELTA_POINTS]
+    payload['location_history'] = [{'lat': latitude, 'lon': longitude} for _, latitude, longitude in recent_locations]
+    payload['cursor'] = recent_locations[-1][0] if recent_locations else since
+    return payload
+
+
+def publish_tracking_update(assistance_request):
+    """Push the current tracking payload to everyone streaming this request"""
+    broker = get_broker()
+    channel = tracking_channel(assistance_request.tracking_id)
+    # Building the payload costs queries, skip it when nobody is listening
+    if broker.has_subscribers(channel):
+        broker.publish(channel, build_tracking_payload(assistance_request))
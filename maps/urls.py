@@ -8,7 +8,9 @@ urlpatterns = [
     path('request-assistance/', views.request_assistance_map, name='request_assistance_map'),
     path('active-tracking/<uuid:tracking_id>/', views.active_tracking, name='active_tracking'),
     path('api/nearby-providers/', views.get_nearby_providers_api, name='nearby_providers_api'),
+    path('api/reverse-geocode/', views.reverse_geocode_api, name='reverse_geocode'),
     path('api/tracking-updates/<uuid:tracking_id>/', views.get_tracking_updates, name='tracking_updates'),
+    path('api/tracking-stream/<uuid:tracking_id>/', views.tracking_stream, name='tracking_stream'),
     path('api/update-provider-location/', views.update_provider_location, name='update_provider_location'),
     path('api/simulate-movement/<uuid:tracking_id>/', views.simulate_provider_movement, name='simulate_movement'),
 ]
\ No newline at end of file
@@ -1,6 +1,13 @@
 import math
 import random
+import numpy as np
+from django.db.models import Q
 from users.models import ServiceProvider
+from . import eta, geohash, routing
+
+KNN_START_PRECISION = 6  # ~1km cells for the first ring of a k-nearest search
+MAX_NEAREST_K = 50
+PROVIDER_ROW_FIELDS = ('id', 'company_name', 'latitude', 'longitude', 'rating')
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points using Haversine formula"""
@@ -16,30 +23,205 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     
     return R * c  # Distance in kilometers
 
-def get_nearby_providers(user_lat, user_lon, service_types=None, max_distance_km=10):
-    """Get nearby service providers within specified distance"""
+def calculate_distances(lat, lon, lats, lons):
+    """Vectorized Haversine distance from one point to arrays of points, in kilometers"""
+    R = 6371  # Earth radius in kilometers
+
+    lat1 = math.radians(lat)
+    lon1 = math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat/2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+    return R * c
+
+def filter_by_proximity(queryset, user_lat, user_lon, max_distance_km):
+    """Narrow a ServiceProvider queryset to the cells and bounding box around a point"""
+    min_lat, max_lat, min_lon, max_lon = geohash.bounding_box(user_lat, user_lon, max_distance_km)
+    queryset = queryset.filter(latitude__range=(min_lat, max_lat))
+    if min_lon is not None:
+        queryset = queryset.filter(longitude__range=(min_lon, max_lon))
+
+    # A 3x3 block of cells at least max_distance_km wide always covers the search circle
+    precision = geohash.precision_for_radius(max_distance_km, user_lat)
+    if precision is not None:
+        center_cell = geohash.encode(user_lat, user_lon, precision)
+        cell_filter = Q()
+        for cell in geohash.neighbors(center_cell):
+            cell_filter |= Q(geohash__startswith=cell)
+        queryset = queryset.filter(cell_filter)
+
+    return queryset
+
+def rank_by_distance(distances, max_distance_km=None, k=None):
+    """Indices of distances within max_distance_km, nearest first, keeping at most k"""
+    if max_distance_km is None:
+        candidates = np.arange(len(distances))
+    else:
+        candidates = np.flatnonzero(distances <= max_distance_km)
+
+    if k is not None and len(candidates) > k:
+        # Partial sort: only the k nearest need ordering
+        nearest = np.argpartition(distances[candidates], k - 1)[:k]
+        candidates = candidates[nearest]
+
+    return candidates[np.argsort(distances[candidates], kind='stable')]
+
+def apply_road_distances(user_lat, user_lon, lats, lons, distances, order, max_distance_km=None, k=None):
+    """Swap straight-line distances of ranked candidates for driving distances when a road graph is loaded
+
+    order must hold every candidate in range, nearest first by straight line. Updates distances
+    in place and returns at most k candidates nearest first by road, dropping any now out of range.
+    Driving distance is never shorter than straight-line, so road distances are only computed for
+    a growing prefix of order, until the k-th by road is no further than the next candidate by
+    straight line.
+    """
+    if not len(order) or routing.get_graph() is None:
+        return order[:k]
+
+    straight = distances[order]
+    limit = max_distance_km if max_distance_km is not None else float(straight[-1])
+    size = k or len(order)
+    while True:
+        head = order[:size]
+        road = routing.road_distances_to(user_lat, user_lon, lats[head], lons[head], limit)
+        # NaN: off the road network, keep the straight line. Inf: no route within limit
+        road = np.where(np.isnan(road), straight[:size], road)
+        ranked = np.argsort(road, kind='stable')
+        if k is None or size >= len(order) or (len(ranked) >= k and road[ranked[k - 1]] <= straight[size]):
+            break
+        size *= 2
+
+    ranked = ranked[:k]
+    head, road = head[ranked], road[ranked]
+    if max_distance_km is not None:
+        in_range = road <= max_distance_km
+        head, road = head[in_range], road[in_range]
+    else:
+        # Routes longer than the furthest straight line: already ranked last, route them one by one
+        for i in np.flatnonzero(np.isinf(road)):
+            distance = routing.road_distance(lats[head[i]], lons[head[i]], user_lat, user_lon)
+            road[i] = distance if distance is not None else distances[head[i]]
+        order = np.argsort(road, kind='stable')
+        head, road = head[order], road[order]
+    distances[head] = road
+    return head
+
+def rank_nearest(user_lat, user_lon, lats, lons, distances, max_distance_km=None, k=None):
+    """Indices of candidates within max_distance_km, nearest first by road when routing is on, at most k"""
+    routed = routing.get_graph() is not None
+    # The road re-rank needs every candidate in range, not just the k nearest by straight line
+    order = rank_by_distance(distances, max_distance_km, None if routed else k)
+    return apply_road_distances(user_lat, user_lon, lats, lons, distances, order, max_distance_km, k)
+
+def rank_providers(providers, user_lat, user_lon, max_distance_km=None, k=None):
+    """Attach distance and eta to providers and return them nearest first"""
+    providers = list(providers)
+    if not providers:
+        return []
+
+    # Providers are either model instances or values() rows
+    as_rows = isinstance(providers[0], dict)
+    if as_rows:
+        lats = np.fromiter((p['latitude'] for p in providers), dtype=np.float64, count=len(providers))
+        lons = np.fromiter((p['longitude'] for p in providers), dtype=np.float64, count=len(providers))
+    else:
+        lats = np.fromiter((p.latitude for p in providers), dtype=np.float64, count=len(providers))
+        lons = np.fromiter((p.longitude for p in providers), dtype=np.float64, count=len(providers))
+    distances = calculate_distances(user_lat, user_lon, lats, lons)
+    order = rank_nearest(user_lat, user_lon, lats, lons, distances, max_distance_km, k)
+    etas = calculate_etas(distances[order], lats[order], lons[order])
+
+    ranked = []
+    for i, eta in zip(order, etas):
+        provider = providers[i]
+        if as_rows:
+            provider['distance'] = round(float(distances[i]), 2)
+            provider['eta'] = int(eta)
+        else:
+            provider.distance = round(float(distances[i]), 2)
+            provider.eta = int(eta)
+        ranked.append(provider)
+    return ranked
+
+def attach_service_names(rows):
+    """Add a 'services' list to provider rows using a single query"""
+    services = {row['id']: [] for row in rows}
+    if services:
+        links = ServiceProvider.services.through.objects.filter(
+            serviceprovider_id__in=list(services)
+        ).order_by('servicecategory_id').values_list('serviceprovider_id', 'servicecategory__name')
+        for provider_id, name in links:
+            services[provider_id].append(name)
+    for row in rows:
+        row['services'] = services[row['id']]
+    return rows
+
+def _available_providers(service_types=None, rows=False):
     providers = ServiceProvider.objects.filter(is_available=True, is_verified=True)
-    
     if service_types:
         # Filter providers that offer any of the requested service types
         providers = providers.filter(services__name__in=service_types).distinct()
-    
-    nearby_providers = []
-    for provider in providers:
-        distance = calculate_distance(user_lat, user_lon, provider.latitude, provider.longitude)
-        if distance <= max_distance_km:
-            provider.distance = round(distance, 2)
-            provider.eta = calculate_eta(distance)
-            nearby_providers.append(provider)
-    
-    # Sort by distance
-    nearby_providers.sort(key=lambda x: x.distance)
-    return nearby_providers
+    if rows:
+        providers = providers.values(*PROVIDER_ROW_FIELDS)
+    return providers
 
-def calculate_eta(distance_km):
-    """Calculate estimated time of arrival in minutes"""
+def get_nearby_providers(user_lat, user_lon, service_types=None, max_distance_km=10, rows=False):
+    """Get nearby service providers within specified distance
+
+    With rows=True, returns values() dicts with service names attached instead of model instances.
+    """
+    providers = filter_by_proximity(_available_providers(service_types, rows), user_lat, user_lon, max_distance_km)
+    ranked = rank_providers(providers, user_lat, user_lon, max_distance_km)
+    return attach_service_names(ranked) if rows else ranked
+
+def get_k_nearest_providers(user_lat, user_lon, k, service_types=None, max_distance_km=None, rows=False):
+    """Get the k nearest service providers, searching outward ring by ring"""
+    ranked = _k_nearest(_available_providers(service_types, rows), user_lat, user_lon, k, max_distance_km)
+    return attach_service_names(ranked) if rows else ranked
+
+def _k_nearest(available, user_lat, user_lon, k, max_distance_km):
+    # Each ring is the 3x3 block of cells around the user at a coarser precision.
+    # Anything within one cell width of the user is guaranteed to be inside the block,
+    # so results closer than that are confirmed and the search can stop.
+    ring = available
+    for precision in range(KNN_START_PRECISION, 0, -1):
+        covered_km = geohash.cell_size_km(precision, user_lat)
+        if max_distance_km is not None and covered_km >= max_distance_km:
+            # Radius reached: rank everything left in range
+            available = filter_by_proximity(available, user_lat, user_lon, max_distance_km)
+            return rank_providers(available, user_lat, user_lon, max_distance_km, k)
+
+        center_cell = geohash.encode(user_lat, user_lon, precision)
+        cell_filter = Q()
+        for cell in geohash.neighbors(center_cell):
+            cell_filter |= Q(geohash__startswith=cell)
+
+        ring = available.filter(cell_filter)
+        confirmed = rank_providers(ring, user_lat, user_lon, covered_km, k)
+        if len(confirmed) >= k:
+            return confirmed
+
+    # Without a radius, stop at the coarsest ring (thousands of km across) rather than scan the table
+    return rank_providers(ring, user_lat, user_lon, max_distance_km, k)
+
+def calculate_eta(distance_km, latitude=None, longitude=None, when=None):
+    """Calculate estimated time of arrival in minutes
+
+    With an origin, uses the historical speed for that area and hour of the week
+    (see maps.eta) when the profile has data for it.
+    """
     # Assuming average speed of 30 km/h in urban areas
     average_speed_kmh = 30
+    if latitude is not None and longitude is not None:
+        profiled = eta.profile_speeds([latitude], [longitude], when)[0]
+        if not np.isnan(profiled):
+            average_speed_kmh = float(profiled)
     travel_time_hours = distance_km / average_speed_kmh
     eta_minutes = int(travel_time_hours * 60)
     
@@ -48,6 +230,17 @@ def calculate_eta(distance_km):
     
     return max(5, eta_minutes)  # Minimum 5 minutes
 
+def calculate_etas(distances_km, lats=None, lons=None, when=None):
+    """Vectorized calculate_eta over an array of distances, in minutes"""
+    distances_km = np.asarray(distances_km, dtype=np.float64)
+    speeds = np.full(distances_km.shape, 30.0)
+    if lats is not None and lons is not None and len(distances_km):
+        profiled = eta.profile_speeds(lats, lons, when)
+        speeds = np.where(np.isnan(profiled), speeds, profiled)
+    travel_time_hours = distances_km / speeds
+    eta_minutes = np.trunc(travel_time_hours * 60).astype(np.int64) + 5
+    return np.maximum(5, eta_minutes)
+
 def generate_sample_providers(user_lat, user_lon, count=10):
     """Generate sample providers around user location for demo"""
     providers = []
@@ -60,6 +253,7 @@ def generate_sample_providers(user_lat, user_lon, count=10):
         
         provider_lat = user_lat + offset_lat
         provider_lon = user_lon + offset_lon
+        distance = calculate_distance(user_lat, user_lon, provider_lat, provider_lon)
         
         providers.append({
             'id': i + 1,
@@ -68,8 +262,8 @@ def generate_sample_providers(user_lat, user_lon, count=10):
             'latitude': provider_lat,
             'longitude': provider_lon,
             'rating': round(random.uniform(3.5, 5.0), 1),
-            'distance': calculate_distance(user_lat, user_lon, provider_lat, provider_lon),
-            'eta': calculate_eta(calculate_distance(user_lat, user_lon, provider_lat, provider_lon)),
+            'distance': distance,
+            'eta': calculate_eta(distance),
             'is_available': True
         })
     
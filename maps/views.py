@@ -1,13 +1,27 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 import json
-from .utils import get_nearby_providers, generate_sample_providers
+from .utils import get_nearby_providers, get_k_nearest_providers, generate_sample_providers, MAX_NEAREST_K
 from bookings.models import AssistanceRequest, ProviderLocation, TripTracking
 from users.models import ServiceProvider
 from .utils import calculate_distance, calculate_eta
+from .snapshot import get_snapshot, query_snapshot
+from . import geocoder, nearby_cache
+from .ingest import get_location_buffer
+from .pubsub import get_broker
+from .tracking import build_tracking_payload, extend_trip_trails, get_latest_location, publish_tracking_update, record_current_locations, tracking_channel, tracking_etag
 import datetime
+import threading
+from django.conf import settings
+from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
+
+TRACKING_KEEPALIVE_SECONDS = 15
+TRACKING_FINAL_STATUSES = ('completed', 'cancelled')
 
 @login_required
 def live_map(request):
@@ -32,23 +46,25 @@ def get_nearby_providers_api(request):
         user_lon = float(request.GET.get('lon', -0.1870))
         service_types = request.GET.getlist('service_type') # Get a list of service types
         
-        # Get providers from database
-        providers = get_nearby_providers(user_lat, user_lon, service_types)
-        
-        # Format data for API response
-        providers_data = [
-            {
-                'id': p.id,
-                'company_name': p.company_name,
-                'latitude': p.latitude,
-                'longitude': p.longitude,
-                'services': [s.name for s in p.services.all()], # Get all service names
-                'rating': p.rating,
-                'distance': calculate_distance(user_lat, user_lon, p.latitude, p.longitude),
-                'eta': calculate_eta(calculate_distance(user_lat, user_lon, p.latitude, p.longitude))
-            }
-            for p in providers
-        ]
+        # Optional k-nearest mode: at most k results, radius only applies if given
+        k = request.GET.get('k')
+        max_distance = request.GET.get('max_distance')
+        if k is not None:
+            k = min(max(int(k), 1), MAX_NEAREST_K)
+            max_distance = float(max_distance) if max_distance else None
+        else:
+            max_distance = float(max_distance) if max_distance else 10
+        
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            # Opt-in via PROVIDER_SNAPSHOT_PATH: served from the shared memory-mapped snapshot, no database access
+            providers_data = query_snapshot(snapshot, user_lat, user_lon, service_types, max_distance, k)
+        # Otherwise read plain rows from the database with service names prefetched
+        elif k is not None:
+            providers_data = get_k_nearest_providers(user_lat, user_lon, k, service_types, max_distance, rows=True)
+        else:
+            # Candidate sets are cached per ~1km cell, distance and ETA are recomputed per driver
+            providers_data = nearby_cache.get_nearby_provider_rows(user_lat, user_lon, service_types, max_distance)
         
         return JsonResponse({
             'success': True,
@@ -58,6 +74,20 @@ def get_nearby_providers_api(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+def reverse_geocode_api(request):
+    """API endpoint to resolve coordinates to the nearest named place, served offline"""
+    try:
+        lat = float(request.GET['lat'])
+        lon = float(request.GET['lon'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'lat and lon are required'}, status=400)
+
+    place = geocoder.reverse_geocode(lat, lon)
+    if place is None:
+        return JsonResponse({'success': False, 'error': 'Reverse geocoding is unavailable'}, status=503)
+    return JsonResponse({'success': True, **place})
+
 @login_required
 def request_assistance_map(request):
     """Request assistance with map interface"""
@@ -91,9 +121,12 @@ def active_tracking(request, tracking_id):
         assistance_request = AssistanceRequest.objects.get(tracking_id=tracking_id)
         
         # Check if user has permission to view this tracking
-        if (request.user != assistance_request.driver.user and 
-            (not hasattr(request.user, 'serviceprovider') or 
-             request.user.serviceprovider != assistance_request.accepted_provider)):
+        # Compare ids against request.profile so neither side of the request is loaded
+        owner_id = {
+            'driver': assistance_request.driver_id,
+            'provider': assistance_request.accepted_provider_id,
+        }.get(request.role)
+        if owner_id is None or owner_id != request.profile.id:
             return JsonResponse({'error': 'Permission denied'}, status=403)
         
         context = {
@@ -107,89 +140,158 @@ def active_tracking(request, tracking_id):
 
 @csrf_exempt
 def update_provider_location(request):
-    """API for provider app to update their location (simulated for demo)"""
+    """API for provider app to update their location (simulated for demo)
+
+    Accepts a single point (latitude/longitude) or a batch under "points". Points
+    are buffered and written in bulk, see maps.ingest.
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             tracking_id = data.get('tracking_id')
-            latitude = data.get('latitude')
-            longitude = data.get('longitude')
+            points = data.get('points')
+            if points is None:
+                points = [data]
             
-            assistance_request = AssistanceRequest.objects.get(tracking_id=tracking_id)
+            assistance_request = AssistanceRequest.objects.only('id', 'accepted_provider_id').get(tracking_id=tracking_id)
+            if assistance_request.accepted_provider_id is None:
+                return JsonResponse({'error': 'Request has no assigned provider'}, status=400)
             
-            # Create location update
-            ProviderLocation.objects.create(
-                provider=assistance_request.accepted_provider,
-                assistance_request=assistance_request,
-                latitude=latitude,
-                longitude=longitude
-            )
+            received_at = timezone.now()
+            locations = []
+            for point in points:
+                timestamp = received_at
+                if point.get('timestamp'):
+                    timestamp = parse_datetime(point['timestamp'])
+                    if timestamp is None:
+                        return JsonResponse({'error': f"Invalid timestamp: {point['timestamp']}"}, status=400)
+                    if timezone.is_naive(timestamp):
+                        # Device clocks without an offset are taken as UTC
+                        timestamp = timezone.make_aware(timestamp, datetime.timezone.utc)
+                locations.append(ProviderLocation(
+                    provider_id=assistance_request.accepted_provider_id,
+                    assistance_request_id=assistance_request.id,
+                    latitude=float(point['latitude']),
+                    longitude=float(point['longitude']),
+                    speed=point.get('speed'),
+                    heading=point.get('heading'),
+                    timestamp=timestamp
+                ))
             
-            return JsonResponse({'success': True})
+            # Queue location updates for the next bulk write
+            get_location_buffer().add(locations)
+            
+            return JsonResponse({'success': True, 'accepted': len(locations)})
             
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
     
     return JsonResponse({'error': 'Invalid method'}, status=405)
 
+def _etag_matches(etag, if_none_match):
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+    return '*' in tags or etag in tags
+
 @login_required
 def get_tracking_updates(request, tracking_id):
-    """API to get latest tracking updates for a request"""
+    """API to get latest tracking updates for a request
+
+    Pass ?since=<cursor> from the previous response to receive only new route points.
+    Responds 304 when If-None-Match matches and nothing has changed.
+    """
     try:
         assistance_request = AssistanceRequest.objects.get(tracking_id=tracking_id)
+        since = request.GET.get('since')
+        since = int(since) if since else None
         
-        # Get latest provider location
-        latest_location = ProviderLocation.objects.filter(
-            assistance_request=assistance_request
-        ).order_by('-timestamp').first()
+        latest_location = get_latest_location(assistance_request)
+        etag = tracking_etag(assistance_request, latest_location, since)
+        if _etag_matches(etag, request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
         
-        # Calculate ETA and distance
-        if latest_location:
-            distance = calculate_distance(
-                latest_location.latitude, latest_location.longitude,
-                assistance_request.latitude, assistance_request.longitude
-            )
-            eta = calculate_eta(distance)
-            
-            # Get recent location history for route line
-            recent_locations = ProviderLocation.objects.filter(
-                assistance_request=assistance_request
-            ).order_by('-timestamp')[:10]
-            
-            location_history = [
-                {'lat': loc.latitude, 'lon': loc.longitude}
-                for loc in recent_locations
-            ]
-            
-            return JsonResponse({
-                'success': True,
-                'provider_location': {
-                    'lat': latest_location.latitude,
-                    'lon': latest_location.longitude,
-                    'timestamp': latest_location.timestamp.isoformat()
-                },
-                'user_location': {
-                    'lat': assistance_request.latitude,
-                    'lon': assistance_request.longitude
-                },
-                'distance': round(distance, 2),
-                'eta': eta,
-                'location_history': location_history,
-                'status': assistance_request.status
-            })
-        else:
-            return JsonResponse({
-                'success': True,
-                'provider_location': None,
-                'user_location': {
-                    'lat': assistance_request.latitude,
-                    'lon': assistance_request.longitude
-                },
-                'status': assistance_request.status
-            })
+        response = JsonResponse(build_tracking_payload(assistance_request, since, latest_location))
+        response['ETag'] = etag
+        return response
             
     except AssistanceRequest.DoesNotExist:
         return JsonResponse({'error': 'Request not found'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+def _tracking_events(assistance_request):
+    """Yield SSE frames: the current state, then one frame per published change, then an end event"""
+    subscription = get_broker().subscribe(tracking_channel(assistance_request.tracking_id))
+    try:
+        payload = build_tracking_payload(assistance_request)
+        yield f'data: {json.dumps(payload)}\n\n'
+        while payload['status'] not in TRACKING_FINAL_STATUSES:
+            message = subscription.get(timeout=TRACKING_KEEPALIVE_SECONDS)
+            if message is None:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+                continue
+            payload = message
+            yield f'data: {json.dumps(payload)}\n\n'
+        # EventSource reconnects after a plain close; the client closes for good on this event
+        yield 'event: end\ndata: {}\n\n'
+    finally:
+        subscription.close()
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+def _acquire_stream_slot():
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= getattr(settings, 'TRACKING_MAX_STREAMS', 20):
+            return False
+        _open_streams += 1
+        return True
+
+def _release_stream_slot():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+class _TrackingStream:
+    """SSE response body that gives its stream slot back when the response closes, even if never read"""
+
+    def __init__(self, assistance_request):
+        self.events = _tracking_events(assistance_request)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.events.close()
+            _release_stream_slot()
+
+@login_required
+def tracking_stream(request, tracking_id):
+    """Server-Sent Events stream of tracking updates, pushed only when something changes
+
+    Under WSGI each open stream holds a worker thread until the trip ends, so at most
+    TRACKING_MAX_STREAMS run per process; beyond that clients get a 503 and fall back to polling.
+    """
+    try:
+        assistance_request = AssistanceRequest.objects.get(tracking_id=tracking_id)
+    except AssistanceRequest.DoesNotExist:
+        return JsonResponse({'error': 'Request not found'}, status=404)
+
+    if assistance_request.status in TRACKING_FINAL_STATUSES:
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    if not _acquire_stream_slot():
+        return JsonResponse({'error': 'Too many open tracking streams, poll tracking-updates instead'}, status=503)
+
+    response = StreamingHttpResponse(_TrackingStream(assistance_request), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @login_required
 def simulate_provider_movement(request, tracking_id):
@@ -201,9 +303,7 @@ def simulate_provider_movement(request, tracking_id):
             return JsonResponse({'error': 'Request not accepted yet'})
         
         # Get provider's current location or start from their base
-        latest_location = ProviderLocation.objects.filter(
-            assistance_request=assistance_request
-        ).order_by('-timestamp').first()
+        latest_location = get_latest_location(assistance_request)
         
         if latest_location:
             current_lat = latest_location.latitude
@@ -222,12 +322,14 @@ def simulate_provider_movement(request, tracking_id):
         new_lon = current_lon + (user_lon - current_lon) * 0.1
         
         # Create new location update
-        ProviderLocation.objects.create(
+        location = ProviderLocation.objects.create(
             provider=assistance_request.accepted_provider,
             assistance_request=assistance_request,
             latitude=new_lat,
             longitude=new_lon
         )
+        record_current_locations([location])
+        extend_trip_trails([location])
         
         # Calculate remaining distance
         remaining_distance = calculate_distance(new_lat, new_lon, user_lat, user_lon)
@@ -236,6 +338,7 @@ def simulate_provider_movement(request, tracking_id):
         if remaining_distance < 0.1:  # 100 meters
             assistance_request.status = 'in_progress'
             assistance_request.save()
+        publish_tracking_update(assistance_request)
         
         return JsonResponse({
             'success': True,
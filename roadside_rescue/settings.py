@@ -33,6 +33,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -59,9 +60,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database so concurrency tests see real locking rather than shared-cache errors
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Redirects the var/ data files to a temporary directory while tests run
+TEST_RUNNER = 'roadside_rescue.test_runner.TestRunner'
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
@@ -72,3 +78,52 @@ LOGIN_URL = '/login/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
+# ProfileBackend joins the driver/provider profile into the per-request user fetch. New
+# logins go through it; ModelBackend stays listed so sessions created before the switch
+# (which record ModelBackend) stay valid until they expire
+AUTHENTICATION_BACKENDS = [
+    'users.backends.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# The nearby-providers API is served from the per-cell cache over the geohash database query by default.
+# Set a path such as BASE_DIR / 'var' / 'provider_snapshot.bin' to serve it from a shared memory-mapped
+# snapshot instead, for many worker processes on one host. The snapshot replaces the cache entirely.
+PROVIDER_SNAPSHOT_PATH = None
+# Provider changes are batched into one snapshot rebuild per this many seconds, 0 rebuilds on every change
+PROVIDER_SNAPSHOT_REBUILD_DELAY = 2
+
+# Seconds a nearby-providers candidate set stays cached for its map cell
+NEARBY_CACHE_TTL = 30
+
+# Pub/sub used to push tracking updates to Server-Sent Events streams
+TRACKING_PUBSUB_BACKEND = 'maps.pubsub.InProcessPubSub'
+# Open tracking streams per process; each holds a WSGI worker thread while the trip is live
+TRACKING_MAX_STREAMS = 20
+
+# Provider location pings are written in bulk once this many are queued or the oldest is this many seconds old
+LOCATION_FLUSH_SIZE = 200
+LOCATION_FLUSH_INTERVAL = 1.0
+# Failed bulk writes are retried this many times, then the points go to the spill file (replay_location_spill)
+LOCATION_FLUSH_ATTEMPTS = 3
+LOCATION_SPILL_PATH = BASE_DIR / 'var' / 'location_spill.jsonl'
+
+# Date-partitioned Parquet archive for location history of finished trips
+LOCATION_ARCHIVE_DIR = BASE_DIR / 'var' / 'location_archive'
+
+# Historical speed profile for ETAs, built by the build_eta_profile command
+ETA_PROFILE_PATH = BASE_DIR / 'var' / 'eta_profile.npz'
+
+# 'haversine' for straight-line distances, 'road' to route over the graph built by build_road_graph
+DISTANCE_BACKEND = 'haversine'
+ROAD_GRAPH_PATH = BASE_DIR / 'var' / 'road_graph.npz'
+
+# Places for offline reverse geocoding: a latitude,longitude,name,region,country CSV or a GeoNames dump
+GEOCODER_GAZETTEER_PATH = BASE_DIR / 'var' / 'gazetteer.csv'
+
+# Batch dispatch (dispatch_requests command): requests collected per round and the furthest provider considered
+DISPATCH_WINDOW_SECONDS = 5
+DISPATCH_MAX_DISTANCE_KM = 30
+
+# Provider dashboard pending-job feed only lists requests this close to the provider
+PROVIDER_FEED_RADIUS_KM = 25
@@ -0,0 +1,34 @@
+import shutil
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Data files under var/ that features read or write at runtime
+VAR_SETTINGS = (
+    'PROVIDER_SNAPSHOT_PATH',
+    'LOCATION_ARCHIVE_DIR',
+    'LOCATION_SPILL_PATH',
+    'ETA_PROFILE_PATH',
+    'ROAD_GRAPH_PATH',
+    'GEOCODER_GAZETTEER_PATH',
+)
+
+
+class TestRunner(DiscoverRunner):
+    """Point every var/ path at a throwaway directory so tests never read or write real data files"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.var_dir = Path(tempfile.mkdtemp(prefix='roadside-test-'))
+        self.var_override = override_settings(**{
+            name: self.var_dir / Path(getattr(settings, name)).name
+            for name in VAR_SETTINGS if getattr(settings, name) is not None
+        })
+        self.var_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.var_override.disable()
+        shutil.rmtree(self.var_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -7,6 +7,8 @@ from maps import views as maps_views
 
 urlpatterns = [
     path('admin/request-history/', main_views.admin_request_history, name='admin_request_history'),
+    path('admin/active-requests/', main_views.admin_active_requests, name='admin_active_requests'),
+    path('admin/request-export/', main_views.admin_request_export, name='admin_request_export'),
     path('admin/', admin.site.urls),
     path('', main_views.home, name='home'),
     path('dashboard/', main_views.dashboard, name='dashboard'),
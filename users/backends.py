@@ -0,0 +1,17 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth import get_user_model
+
+
+class ProfileBackend(ModelBackend):
+    """ModelBackend that loads the driver and provider profiles in the same query as the user"""
+
+    def get_user(self, user_id):
+        # Reverse one-to-one select_related also caches a missing profile as None,
+        # so hasattr(user, 'driver') and user.serviceprovider never query again
+        user = (
+            get_user_model()._default_manager
+            .select_related('driver', 'serviceprovider')
+            .filter(pk=user_id)
+            .first()
+        )
+        return user if user is not None and self.user_can_authenticate(user) else None
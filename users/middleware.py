@@ -0,0 +1,28 @@
+from django.core.exceptions import ObjectDoesNotExist
+
+
+def resolve_profile(user):
+    """(role, profile) for a user: ('driver', Driver), ('provider', ServiceProvider), ('admin', None) or (None, None)"""
+    if not user.is_authenticated:
+        return None, None
+    for role, relation in (('driver', 'driver'), ('provider', 'serviceprovider')):
+        try:
+            return role, getattr(user, relation)
+        except ObjectDoesNotExist:
+            pass
+    return ('admin', None) if user.is_superuser else (None, None)
+
+
+class ProfileMiddleware:
+    """Set request.role and request.profile once per request, after AuthenticationMiddleware
+
+    With users.backends.ProfileBackend the profile arrives joined to the user,
+    so views and templates can check the role without further queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role, request.profile = resolve_profile(request.user)
+        return self.get_response(request)
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+# Frozen copy of maps.geohash.encode so this migration does not depend on live code
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        target, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (target[0] + target[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            target[0] = mid
+        else:
+            bits = bits << 1
+            target[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def populate_geohash(apps, schema_editor):
+    ServiceProvider = apps.get_model('users', 'ServiceProvider')
+    providers = list(ServiceProvider.objects.only('id', 'latitude', 'longitude'))
+    for provider in providers:
+        provider.geohash = encode_geohash(provider.latitude, provider.longitude)
+    ServiceProvider.objects.bulk_update(providers, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_remove_serviceprovider_service_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprovider',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
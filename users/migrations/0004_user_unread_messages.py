@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_serviceprovider_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_messages',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
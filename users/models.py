@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from maps.geohash import encode as encode_geohash
 
 class User(AbstractUser):
     USER_TYPE_CHOICES = (
@@ -10,6 +11,21 @@ class User(AbstractUser):
     user_type = models.CharField(max_length=20, choices=USER_TYPE_CHOICES, default='driver')
     phone_number = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
+    # Unread inbox messages, maintained by communication.counters so the badge needs no COUNT
+    unread_messages = models.PositiveIntegerField(default=0, editable=False)
+    
+    def save(self, *args, **kwargs):
+        # unread_messages is only changed by relative UPDATEs in communication.counters. A full
+        # save of an existing user would write back the value loaded with this instance and undo
+        # messages that arrived since, so it is left out unless update_fields names it
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Deferred fields were not loaded, so like a plain save they are not written either
+            skipped = self.get_deferred_fields() | {'unread_messages'}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
@@ -24,6 +40,28 @@ class Driver(models.Model):
     def __str__(self):
         return f"Driver: {self.user.username}"
 
+class ServiceProviderQuerySet(models.QuerySet):
+    """Keeps geohash in step with coordinates written by update() and bulk_update()"""
+
+    def update(self, **kwargs):
+        # bulk_update() below passes geohash itself, already recomputed per row
+        if 'geohash' not in kwargs and ('latitude' in kwargs or 'longitude' in kwargs):
+            latitude, longitude = kwargs.get('latitude'), kwargs.get('longitude')
+            if not all(isinstance(value, (int, float)) for value in (latitude, longitude)):
+                # An expression or a single coordinate gives no value to hash; save() each provider instead
+                raise ValueError('update() must set both latitude and longitude as numbers to keep geohash current')
+            kwargs['geohash'] = encode_geohash(latitude, longitude)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        objs, fields = list(objs), list(fields)
+        if 'latitude' in fields or 'longitude' in fields:
+            for provider in objs:
+                provider.geohash = encode_geohash(provider.latitude, provider.longitude)
+            if 'geohash' not in fields:
+                fields.append('geohash')
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
 class ServiceProvider(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     company_name = models.CharField(max_length=100)
@@ -35,6 +73,30 @@ class ServiceProvider(models.Model):
     is_verified = models.BooleanField(default=False)
     is_available = models.BooleanField(default=True)
     rating = models.FloatField(default=0.0)
+    # Derived from latitude/longitude by save(), update() and bulk_update(). A raw SQL write to the
+    # coordinates leaves it stale and the provider drops out of proximity and k-nearest searches.
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    objects = ServiceProviderQuerySet.as_manager()
+
+    # Coordinates as last read from or written to the database, see from_db
+    loaded_location = (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets change handlers see where the provider was without re-reading the row
+        instance.loaded_location = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
     
+    def save(self, *args, **kwargs):
+        # Keep the spatial index key in sync with the stored coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and ('latitude' in update_fields or 'longitude' in update_fields):
+                kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.company_name} ({', '.join(self.services.values_list('name', flat=True))})"
@@ -8,6 +8,7 @@ from django.views import View
 from .forms import CustomUserCreationForm, ServiceProviderServiceForm, UserUpdateForm, DriverUpdateForm, ServiceProviderUpdateForm, CustomPasswordChangeForm
 from .models import ServiceProvider, Driver
 from bookings.models import AssistanceRequest
+from bookings.pagination import render_page
 
 class ServiceProviderServiceView(LoginRequiredMixin, View):
     template_name = 'users/service_provider_services.html'
@@ -78,15 +79,15 @@ class PaymentSettingsView(LoginRequiredMixin, View):
 def user_request_history(request):
     requests = AssistanceRequest.objects.none()
 
-    if hasattr(request.user, 'driver'):
-        requests = AssistanceRequest.objects.filter(driver=request.user.driver).order_by('-created_at')
-    elif hasattr(request.user, 'serviceprovider'):
-        requests = AssistanceRequest.objects.filter(accepted_provider=request.user.serviceprovider).order_by('-created_at')
+    if request.role == 'driver':
+        requests = AssistanceRequest.objects.filter(driver=request.profile)
+    elif request.role == 'provider':
+        requests = AssistanceRequest.objects.filter(accepted_provider=request.profile)
     elif request.user.is_superuser:
-        requests = AssistanceRequest.objects.all().order_by('-created_at')
+        requests = AssistanceRequest.objects.all()
     
-    context = {'requests': requests}
-    return render(request, 'request_history.html', context)
+    # Seek pagination on (created_at, id), see bookings.pagination
+    return render_page(request, 'request_history.html', requests.select_related('driver__user', 'accepted_provider'))
 
 def register(request):
     if request.user.is_authenticated: